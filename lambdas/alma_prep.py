@@ -1,9 +1,16 @@
+import base64
+import json
 import logging
+import queue
 import tarfile
-from collections.abc import Generator
+import threading
+import time
+from collections.abc import Callable, Generator
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from datetime import datetime
 from typing import IO, TYPE_CHECKING
 
-import boto3
 import smart_open  # type: ignore[import]
 
 if TYPE_CHECKING:
@@ -11,22 +18,58 @@ if TYPE_CHECKING:
 
     from lambdas.format_input import InputPayload
 
-from lambdas import helpers
+from lambdas import clients, errors, helpers, key_index
+from lambdas.buffers import BufferPool, Writable
 from lambdas.config import Config
+from lambdas.multipart_upload import ParallelMultipartUpload
+from lambdas.sharding import RecordShardWriter
+from lambdas.xml_validation import XMLRecordValidator
 
 logger = logging.getLogger(__name__)
 
 CONFIG = Config()
 
 
+@dataclass
+class ExtractedFile:
+    """A file extracted from an Alma export tarball and written to the TIMDEX bucket."""
+
+    key: str
+    size: int
+    record_count: int
+
+
 def extract_file_from_source_bucket_to_target_bucket(
     s3_client: "S3Client",
     source_bucket: str,
     source_file_key: str,
     target_bucket: str,
-    target_file_key: str,
-) -> None:
-    """Extract a single tarred file from one s3 bucket to another s3 bucket."""
+    target_file_keys: Callable[[int, int], str],
+) -> list[ExtractedFile]:
+    """Extract every member of a tarred file from one s3 bucket to another s3 bucket.
+
+    Members are extracted in a single streaming pass, each written to the target bucket
+    with a parallel multipart upload, see ParallelMultipartUpload. As it streams, each
+    member is checked to be well-formed XML and its records are counted, see
+    XMLRecordValidator; malformed or truncated XML raises errors.InvalidXMLError and
+    aborts the upload. If env vars
+    ALMA_PREP_SHARD_MAX_SIZE_MB or ALMA_PREP_SHARD_MAX_RECORDS are set, each member is
+    further split on <record> boundaries into shards of that size, see
+    RecordShardWriter.
+
+    Args:
+        s3_client: S3 client used for both reading and writing.
+        source_bucket: Bucket of the tarred source file.
+        source_file_key: Key of the tarred source file.
+        target_bucket: Bucket to write extracted files to.
+        target_file_keys: Called with the 1-based number of each tarball member and
+            of each shard of that member, and returns the key to write it to.
+
+    Returns:
+        list[ExtractedFile]: The key, size and record count of each extracted file, in
+            member order.
+    """
+    extracted_files = []
     transport_params = {"client": s3_client}
     with smart_open.open(
         f"s3://{source_bucket}/{source_file_key}",
@@ -34,31 +77,177 @@ def extract_file_from_source_bucket_to_target_bucket(
         transport_params=transport_params,
     ) as tar_file:
         logger.debug("Extracting file '%s'", source_file_key)
-        file_contents = next(extract_tarfile(tar_file))
-        with smart_open.open(
-            f"s3://{target_bucket}/{target_file_key}",
-            "wb",
-            transport_params=transport_params,
-        ) as out_file:
-            while True:
-                chunk = file_contents.read(8 * 1024 * 1024)
-                if not chunk:
+        for member_number, file_contents in enumerate(extract_tarfile(tar_file), 1):
+
+            def open_target_file(
+                shard_number: int, member_number: int = member_number
+            ) -> ParallelMultipartUpload:
+                return ParallelMultipartUpload(
+                    s3_client,
+                    target_bucket,
+                    target_file_keys(member_number, shard_number),
+                    part_size=CONFIG.alma_prep_upload_part_size,
+                    max_in_flight=CONFIG.alma_prep_upload_max_in_flight,
+                )
+
+            member_name = f"{source_file_key}:{member_number}"
+            if CONFIG.alma_prep_shard_max_size or CONFIG.alma_prep_shard_max_records:
+                with RecordShardWriter(
+                    open_target_file,
+                    max_bytes=CONFIG.alma_prep_shard_max_size,
+                    max_records=CONFIG.alma_prep_shard_max_records,
+                ) as shard_writer:
+                    validator = XMLRecordValidator(shard_writer, member_name)
+                    timings = pipe_file_contents(
+                        file_contents,
+                        validator,
+                        CONFIG.alma_prep_upload_part_size,
+                        CONFIG.ALMA_PREP_PIPE_BUFFERS,
+                    )
+                    validator.close()
+                member_files = [
+                    ExtractedFile(shard.key, shard.bytes_written, record_count)
+                    for shard, record_count in zip(
+                        shard_writer.shards, shard_writer.shard_record_counts, strict=True
+                    )
+                ]
+            else:
+                with open_target_file(1) as out_file:
+                    validator = XMLRecordValidator(out_file, member_name)
+                    timings = pipe_file_contents(
+                        file_contents,
+                        validator,
+                        CONFIG.alma_prep_upload_part_size,
+                        CONFIG.ALMA_PREP_PIPE_BUFFERS,
+                    )
+                    validator.close()
+                member_files = [
+                    ExtractedFile(
+                        out_file.key, out_file.bytes_written, validator.record_count
+                    )
+                ]
+            for member_file in member_files:
+                logger.debug(
+                    "File '%s' member %s extracted from bucket '%s' and uploaded to "
+                    "bucket '%s' with new file name %s (%s records)",
+                    source_file_key,
+                    member_number,
+                    source_bucket,
+                    target_bucket,
+                    member_file.key,
+                    member_file.record_count,
+                )
+            extracted_files.extend(member_files)
+            logger.info(
+                "File '%s' member %s pipeline timings: decompress %.2fs (%.2fs waiting "
+                "on upload), upload %.2fs (%.2fs waiting on decompress)",
+                source_file_key,
+                member_number,
+                timings.read_seconds,
+                timings.read_wait_seconds,
+                timings.write_seconds,
+                timings.write_wait_seconds,
+            )
+    if not extracted_files:
+        logger.warning("File '%s' contained no files to extract", source_file_key)
+    return extracted_files
+
+
+@dataclass
+class PipelineTimings:
+    """Time spent in each stage of a pipe_file_contents() transfer.
+
+    Wait times are the time each stage spent blocked on the buffer queue: a producer
+    that waits on a full queue is faster than its consumer, and vice versa.
+    """
+
+    read_seconds: float = 0.0
+    read_wait_seconds: float = 0.0
+    write_seconds: float = 0.0
+    write_wait_seconds: float = 0.0
+
+
+def pipe_file_contents(
+    source: IO[bytes],
+    target: Writable,
+    chunk_size: int,
+    buffers: int = 2,
+) -> PipelineTimings:
+    """Copy a file object to a writable target, overlapping reads and writes.
+
+    Chunks are read (and so decompressed, for a tar member) in a producer thread and
+    handed to the calling thread, which writes (and so uploads) them. Reading chunk N+1
+    therefore overlaps writing chunk N.
+
+    Chunks are read with readinto() into a BufferPool of `buffers` + 1 preallocated
+    buffers and passed to the target as memoryview slices, so no memory is allocated
+    per chunk and memory use is fixed at (buffers + 1) * chunk_size regardless of file
+    size. The target must copy or consume each chunk before its write() returns.
+
+    Errors in either stage stop the other and are raised in the calling thread.
+    """
+    timings = PipelineTimings()
+    pool = BufferPool(buffers + 1, chunk_size)
+    chunks: queue.SimpleQueue[tuple[bytearray, int] | BaseException] = queue.SimpleQueue()
+    stop = threading.Event()
+
+    def acquire() -> bytearray | None:
+        wait_start = time.perf_counter()
+        try:
+            while not stop.is_set():
+                try:
+                    return pool.acquire(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return None
+        finally:
+            timings.read_wait_seconds += time.perf_counter() - wait_start
+
+    def produce() -> None:
+        try:
+            while (buffer := acquire()) is not None:
+                read_start = time.perf_counter()
+                size = source.readinto(buffer)  # type: ignore[attr-defined]
+                timings.read_seconds += time.perf_counter() - read_start
+                chunks.put((buffer, size))
+                if not size:
                     break
-                out_file.write(chunk)
-        logger.debug(
-            "File '%s' extracted from bucket '%s' and uploaded to bucket '%s' with new "
-            "file name %s",
-            source_file_key,
-            source_bucket,
-            target_bucket,
-            target_file_key,
-        )
+        except BaseException as error:  # noqa: BLE001
+            chunks.put(error)
+
+    producer = threading.Thread(target=produce, name="alma-prep-read", daemon=True)
+    producer.start()
+    try:
+        while True:
+            wait_start = time.perf_counter()
+            chunk = chunks.get()
+            timings.write_wait_seconds += time.perf_counter() - wait_start
+            if isinstance(chunk, BaseException):
+                raise chunk
+            buffer, size = chunk
+            if not size:
+                break
+            write_start = time.perf_counter()
+            with memoryview(buffer) as view:
+                target.write(view[:size])
+            timings.write_seconds += time.perf_counter() - write_start
+            pool.release(buffer)
+    finally:
+        stop.set()
+        producer.join()
+    return timings
 
 
 def extract_tarfile(tar_file: IO[bytes]) -> Generator[IO[bytes], None, None]:
-    """Extract the contents of a tarfile and yield each member."""
-    with tarfile.open(fileobj=tar_file) as tar:
-        for member in tar.getmembers():
+    """Extract the contents of a tarfile and yield each member.
+
+    The tarfile is read as a forward-only stream ("r|*" mode): each member is yielded
+    as soon as its header is read, and the source is decompressed exactly once with no
+    member index scan or backward seeks. Because of this, each yielded member must be
+    fully read before the next member is requested.
+    """
+    with tarfile.open(fileobj=tar_file, mode="r|*") as tar:
+        for member in tar:
             contents = tar.extractfile(member)
             if contents:
                 yield contents
@@ -93,7 +282,212 @@ def get_load_type_and_sequence_from_alma_export_filename(
     return (load_type, sequence)
 
 
-def prepare_alma_export_files(input_payload: "InputPayload") -> None:
+def get_alma_export_member_sequence(
+    file_sequence: str | None, member_number: int, shard_number: int = 1
+) -> str | None:
+    """Get the TIMDEX extract file sequence for a member of an Alma export tarball.
+
+    The first member (and first shard) keeps the export file's own sequence, so
+    single-member, unsharded tarballs are extracted to the same file name as before.
+    Later members and shards are numbered after it: e.g. members of
+    "..._new_1.tar.gz" get sequences "01", "01-02", "01-03", and members of an
+    unsequenced "..._delete.tar.gz" get None, "02", "03". Shards after the first add
+    the member and shard numbers, e.g. "01-01-02" for the second shard of the first
+    member of "..._new_1.tar.gz".
+    """
+    sequence_parts = [file_sequence] if file_sequence else []
+    if member_number > 1 or shard_number > 1:
+        sequence_parts.append(str(member_number).zfill(2))
+    if shard_number > 1:
+        sequence_parts.append(str(shard_number).zfill(2))
+    return "-".join(sequence_parts) or None
+
+
+class ExtractManifest:
+    """Record of the Alma export files already extracted for a run date and type.
+
+    The manifest is a JSON object in the TIMDEX S3 bucket mapping each extracted export
+    file key to its source ETag and size and the files it was extracted to. It is saved
+    after every extracted export file, so a retried transform step can skip exports
+    whose extracted files already exist and whose source is unchanged.
+    """
+
+    def __init__(
+        self,
+        s3_client: "S3Client",
+        bucket: str,
+        key: str,
+        entries: dict[str, dict] | None = None,
+    ):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.entries = entries or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, s3_client: "S3Client", bucket: str, key: str) -> "ExtractManifest":
+        return cls(
+            s3_client, bucket, key, helpers.read_json_object(s3_client, bucket, key)
+        )
+
+    def get_extracted_files(
+        self, export_file: helpers.S3File, existing_files: dict[str, helpers.S3File]
+    ) -> list[ExtractedFile] | None:
+        """Return the files an export was extracted to, if still current.
+
+        Returns None if the export is not in the manifest, its source ETag or size has
+        changed, or any of its extracted files is not in `existing_files` (a listing of
+        the run's extract prefix) with the size it was written at.
+        """
+        entry = self.entries.get(export_file.key)
+        if (
+            not entry
+            or entry["etag"] != export_file.etag
+            or entry["size"] != export_file.size
+        ):
+            return None
+        extracted_files = [
+            ExtractedFile(**extracted_file) for extracted_file in entry["files"]
+        ]
+        for extracted_file in extracted_files:
+            existing_file = existing_files.get(extracted_file.key)
+            if not existing_file or existing_file.size != extracted_file.size:
+                return None
+        return extracted_files
+
+    @property
+    def extracted_files(self) -> list[ExtractedFile]:
+        """Return all files extracted for the run so far, ordered by key."""
+        return sorted(
+            (
+                ExtractedFile(**extracted_file)
+                for entry in self.entries.values()
+                for extracted_file in entry["files"]
+            ),
+            key=lambda extracted_file: extracted_file.key,
+        )
+
+    def record(
+        self, export_file: helpers.S3File, extracted_files: list[ExtractedFile]
+    ) -> None:
+        """Add an extracted export file to the manifest and save it to S3."""
+        with self._lock:
+            self.entries[export_file.key] = {
+                "etag": export_file.etag,
+                "size": export_file.size,
+                "files": [asdict(extracted_file) for extracted_file in extracted_files],
+            }
+            helpers.write_json_object(self.s3_client, self.bucket, self.key, self.entries)
+
+
+class TimeBudget:
+    """Track whether an invocation has time left to start another export file.
+
+    A new file may be started only if the time remaining before the deadline exceeds
+    the reserve plus the longest extraction seen so far in this invocation.
+    """
+
+    def __init__(self, deadline: float | None, reserve_seconds: float):
+        self.deadline = deadline
+        self.reserve_seconds = reserve_seconds
+        self.longest_file_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def allows_next_file(self) -> bool:
+        if self.deadline is None:
+            return True
+        with self._lock:
+            needed = self.reserve_seconds + self.longest_file_seconds
+        return self.deadline - time.monotonic() > needed
+
+    def record_file(self, seconds: float) -> None:
+        with self._lock:
+            self.longest_file_seconds = max(self.longest_file_seconds, seconds)
+
+
+@dataclass
+class AlmaPrepResult:
+    """Outcome of prepare_alma_export_files().
+
+    `extracted_files` lists every file extracted for the run so far, including those
+    from earlier invocations, with its key, size and record count. It is the manifest of
+    files to transform, so the TIMDEX bucket need not be listed to find them.
+
+    If the invocation ran out of time, `remaining_export_files` lists the export files
+    not yet started, to be resumed via a continuation token.
+    """
+
+    extracted_files: list[ExtractedFile]
+    remaining_export_files: list[helpers.S3File]
+
+
+def encode_continuation_token(remaining_export_files: list[helpers.S3File]) -> str:
+    """Encode the Alma export files still to extract as an opaque continuation token.
+
+    The token includes each export file's listed size and ETag, so resuming needs no
+    further requests to check the files against the extract manifest.
+    """
+    payload = json.dumps(
+        {
+            "remaining-export-files": [
+                {
+                    "key": export_file.key,
+                    "size": export_file.size,
+                    "etag": export_file.etag,
+                    "last-modified": export_file.last_modified.isoformat(),
+                }
+                for export_file in remaining_export_files
+            ]
+        }
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_continuation_token(continuation_token: str) -> list[helpers.S3File]:
+    """Decode a continuation token into the Alma export files still to extract."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(continuation_token))
+        return [
+            helpers.S3File(
+                key=export_file["key"],
+                size=export_file["size"],
+                etag=export_file["etag"],
+                last_modified=datetime.fromisoformat(export_file["last-modified"]),
+            )
+            for export_file in payload["remaining-export-files"]
+        ]
+    except (ValueError, KeyError, TypeError) as error:
+        message = f"Invalid 'continuation-token' value: '{continuation_token}'"
+        raise ValueError(message) from error
+
+
+def summarize_extracted_files(extracted_files: list[ExtractedFile]) -> dict:
+    """Summarize extracted files, with totals, for the transform step result payload.
+
+    Only totals are returned, to keep the Step Function state payload small; per-file
+    sizes and record counts are kept in the extract manifest.
+    """
+    return {
+        "file-count": len(extracted_files),
+        "record-count": sum(
+            extracted_file.record_count for extracted_file in extracted_files
+        ),
+        "bytes": sum(extracted_file.size for extracted_file in extracted_files),
+    }
+
+
+def generate_extract_manifest_key(input_payload: "InputPayload") -> str:
+    """Generate the TIMDEX S3 key of the Alma extract manifest for a run."""
+    return (
+        f"alma/manifests/alma-{input_payload.run_date}-{input_payload.run_type}-"
+        "extract-manifest.json"
+    )
+
+
+def prepare_alma_export_files(
+    input_payload: "InputPayload", deadline: float | None = None
+) -> AlmaPrepResult:
     """Extract and unzip alma export files to the TIMDEX S3 bucket.
 
     Alma files are exported to an SFTP S3 bucket as gzipped tarfiles. Prior to the
@@ -101,31 +495,206 @@ def prepare_alma_export_files(input_payload: "InputPayload") -> None:
     extracted, renamed following the TIMDEX pipeline file naming convention, and
     uploaded to the TIMDEX S3 bucket. This function identifies the Alma files from a
     given export using the export job date and expected export file naming convention,
-    then performs the extract, unzip, rename and upload steps.
+    then performs the extract, unzip, rename and upload steps. Every member of a
+    multi-member tarball is extracted to its own sequenced file, see
+    get_alma_export_member_sequence.
+
+    When env var ALMA_PREP_MAX_WORKERS is greater than one, export files are extracted
+    concurrently by a bounded pool of worker threads sharing a single S3 client, see
+    clients.get_s3_client. The
+    first failed extraction cancels any extractions not yet started and is re-raised.
+
+    Export files already extracted by a previous attempt for the same run date and type
+    are skipped, see ExtractManifest. Existing extracted files are looked up in the run's
+    step output index, which is invalidated once extraction ends, see
+    key_index.get_step_output_index.
+
+    If a deadline (a time.monotonic() value) is given, no new export file is started
+    once the time left may not be enough to finish it, see TimeBudget. Export files not
+    started are returned in the result; passing them back as the input payload's
+    continuation token resumes extraction from that point.
     """
-    export_job_date = input_payload.run_date.replace("-", "")
-    alma_bucket = CONFIG.alma_export_bucket
-    alma_export_files = helpers.list_s3_files_by_prefix(
-        alma_bucket,
-        f"exlibris/timdex/TIMDEX_ALMA_EXPORT_{input_payload.run_type.upper()}_{export_job_date}",
+    if input_payload.continuation_token:
+        alma_export_files = decode_continuation_token(input_payload.continuation_token)
+        logger.info(
+            "Resuming extraction of %s remaining Alma export files for date %s",
+            len(alma_export_files),
+            input_payload.run_date,
+        )
+    else:
+        export_job_date = input_payload.run_date.replace("-", "")
+        alma_export_files = helpers.list_s3_objects_by_prefix(
+            CONFIG.alma_export_bucket,
+            f"exlibris/timdex/TIMDEX_ALMA_EXPORT_{input_payload.run_type.upper()}_{export_job_date}",
+        )
+        logger.info(
+            "%s Alma export files (%s bytes) found in S3 for date %s",
+            len(alma_export_files),
+            sum(export_file.size for export_file in alma_export_files),
+            input_payload.run_date,
+        )
+    max_workers = min(CONFIG.alma_prep_max_workers, len(alma_export_files))
+    pool_connections = max_workers * (CONFIG.alma_prep_upload_max_in_flight + 1)
+    s3_client = clients.get_s3_client(max_pool_connections=pool_connections)
+    manifest = ExtractManifest.load(
+        s3_client, CONFIG.timdex_bucket, generate_extract_manifest_key(input_payload)
     )
-    logger.info(
-        "%s Alma export files found in S3 for date %s",
-        len(alma_export_files),
-        input_payload.run_date,
+    existing_files = (
+        list_existing_extracted_files(input_payload) if manifest.entries else {}
     )
-    s3_client = boto3.client("s3")
-    for export_file in alma_export_files:
-        load_type, sequence = get_load_type_and_sequence_from_alma_export_filename(
+    time_budget = TimeBudget(deadline, CONFIG.alma_prep_time_reserve_seconds)
+
+    def extract_if_time_allows(
+        export_file: helpers.S3File,
+    ) -> list[ExtractedFile] | None:
+        if not time_budget.allows_next_file():
+            return None
+        file_start = time.perf_counter()
+        extracted_files = extract_alma_export_file(
+            s3_client, input_payload, export_file, manifest, existing_files
+        )
+        time_budget.record_file(time.perf_counter() - file_start)
+        return extracted_files
+
+    run_start = time.perf_counter()
+    try:
+        if max_workers == 1:
+            results = [
+                extract_if_time_allows(export_file) for export_file in alma_export_files
+            ]
+        else:
+            results = _extract_alma_export_files_concurrently(
+                extract_if_time_allows, alma_export_files, max_workers
+            )
+    finally:
+        # extracted files were written, so cached listings of the run are stale
+        key_index.invalidate_step_output_index(input_payload)
+    invocation_files = [
+        extracted_file for result in results if result for extracted_file in result
+    ]
+    prep_result = AlmaPrepResult(
+        extracted_files=manifest.extracted_files,
+        remaining_export_files=[
             export_file
+            for export_file, result in zip(alma_export_files, results, strict=True)
+            if result is None
+        ],
+    )
+    logger.info(
+        "%s Alma export files extracted to %s files (%s records, %s bytes) in %.2f "
+        "seconds using %s worker(s)",
+        len(alma_export_files) - len(prep_result.remaining_export_files),
+        len(invocation_files),
+        sum(extracted_file.record_count for extracted_file in invocation_files),
+        sum(extracted_file.size for extracted_file in invocation_files),
+        time.perf_counter() - run_start,
+        max_workers,
+    )
+    if prep_result.remaining_export_files:
+        logger.warning(
+            "Time budget reached, %s Alma export files left to extract",
+            len(prep_result.remaining_export_files),
         )
-        extract_output_file = helpers.generate_step_output_filename(
-            "alma",
-            load_type,
-            helpers.generate_step_output_prefix(input_payload, "extract"),
-            "extract",
-            sequence,
+    elif not prep_result.extracted_files:
+        logger.error(
+            "Alma export files for date %s had no members", input_payload.run_date
         )
-        extract_file_from_source_bucket_to_target_bucket(
-            s3_client, alma_bucket, export_file, CONFIG.timdex_bucket, extract_output_file
+        raise errors.NoFilesError
+    return prep_result
+
+
+def list_existing_extracted_files(
+    input_payload: "InputPayload",
+) -> dict[str, helpers.S3File]:
+    """Return the files already under the run's extract prefix, by key."""
+    return {
+        existing_file.key: existing_file
+        for existing_file in key_index.get_step_output_index(input_payload).find(
+            input_payload.run_type, "extract"
+        )
+    }
+
+
+def extract_alma_export_file(
+    s3_client: "S3Client",
+    input_payload: "InputPayload",
+    export_file: helpers.S3File,
+    manifest: ExtractManifest,
+    existing_files: dict[str, helpers.S3File],
+) -> list[ExtractedFile]:
+    """Extract each member of an Alma export file to its TIMDEX extract file name.
+
+    The export file is skipped if the manifest shows it was already extracted from an
+    unchanged source to files that still exist, otherwise it is extracted and recorded
+    in the manifest. Both checks use listed object metadata, so no requests are made
+    for skipped files.
+
+    Returns:
+        list[ExtractedFile]: The files written to the TIMDEX S3 bucket.
+    """
+    if extracted_files := manifest.get_extracted_files(export_file, existing_files):
+        logger.info(
+            "Alma export file '%s' already extracted to %s, skipping",
+            export_file.key,
+            [extracted_file.key for extracted_file in extracted_files],
         )
+        return extracted_files
+
+    load_type, sequence = get_load_type_and_sequence_from_alma_export_filename(
+        export_file.key
+    )
+
+    def target_file_keys(member_number: int, shard_number: int) -> str:
+        return key_index.StepOutputKey.for_run(
+            input_payload,
+            "extract",
+            load_type,
+            get_alma_export_member_sequence(sequence, member_number, shard_number),
+        ).encode()
+
+    file_start = time.perf_counter()
+    extracted_files = extract_file_from_source_bucket_to_target_bucket(
+        s3_client,
+        CONFIG.alma_export_bucket,
+        export_file.key,
+        CONFIG.timdex_bucket,
+        target_file_keys,
+    )
+    logger.info(
+        "Alma export file '%s' extracted to %s file(s) %s (%s bytes) in %.2f seconds",
+        export_file.key,
+        len(extracted_files),
+        [extracted_file.key for extracted_file in extracted_files],
+        sum(extracted_file.size for extracted_file in extracted_files),
+        time.perf_counter() - file_start,
+    )
+    manifest.record(export_file, extracted_files)
+    return extracted_files
+
+
+def _extract_alma_export_files_concurrently(
+    extract: Callable[[helpers.S3File], list[ExtractedFile] | None],
+    alma_export_files: list[helpers.S3File],
+    max_workers: int,
+) -> list[list[ExtractedFile] | None]:
+    """Extract Alma export files using a bounded pool of worker threads.
+
+    Waits until all extractions complete or the first one fails. On failure, pending
+    extractions are cancelled and the original exception is raised; extractions
+    already in progress are allowed to finish so no partial uploads are left behind.
+
+    Returns:
+        list: The result of `extract` for each export file, in input order.
+    """
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="alma-prep"
+    ) as executor:
+        futures = [executor.submit(extract, file) for file in alma_export_files]
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            if error := future.exception():
+                for pending in not_done:
+                    pending.cancel()
+                logger.error("Alma export extraction failed, cancelling remaining files")
+                raise error
+    return [future.result() for future in futures]
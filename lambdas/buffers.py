@@ -0,0 +1,47 @@
+import queue
+import threading
+from typing import TYPE_CHECKING, Protocol
+
+if TYPE_CHECKING:
+    from collections.abc import Buffer  # pragma: no cover
+
+
+class Writable(Protocol):
+    """A target that chunks are written to, e.g. a file or ParallelMultipartUpload."""
+
+    def write(self, data: "Buffer", /) -> int: ...  # pragma: no cover
+
+
+class BufferPool:
+    """A fixed-size pool of reusable, equally sized bytearray buffers.
+
+    Buffers are allocated lazily, up to `count`, and then recycled: once all buffers are
+    in use, acquire() blocks until one is released. Streaming a file through a pool
+    therefore allocates at most count * size bytes, however large the file is.
+    """
+
+    def __init__(self, count: int, size: int):
+        self.count = count
+        self.size = size
+        self._free: queue.SimpleQueue[bytearray] = queue.SimpleQueue()
+        self._allocated = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float | None = None) -> bytearray:
+        """Return a free buffer, blocking until one is available.
+
+        Raises:
+            queue.Empty: No buffer was released within `timeout` seconds.
+        """
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._allocated < self.count:
+                    self._allocated += 1
+                    return bytearray(self.size)
+        return self._free.get(timeout=timeout)
+
+    def release(self, buffer: bytearray) -> None:
+        """Return a buffer to the pool for reuse."""
+        self._free.put(buffer)
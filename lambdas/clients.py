@@ -0,0 +1,63 @@
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+import boto3
+from botocore.config import Config as BotoConfig
+
+from lambdas.config import Config
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.client import S3Client  # pragma: no cover
+
+logger = logging.getLogger(__name__)
+
+CONFIG = Config()
+
+_session: boto3.session.Session | None = None
+_s3_clients: dict[int, "S3Client"] = {}
+_lock = threading.Lock()
+
+
+def get_s3_client(max_pool_connections: int | None = None) -> "S3Client":
+    """Return a shared S3 client, reused across warm Lambda invocations.
+
+    Clients are created from a single module-level boto3 session and cached by
+    connection pool size, so endpoint resolution, credential loading and open TLS
+    connections are reused by later calls and invocations. Clients are configured from
+    env vars, see Config.s3_max_pool_connections, Config.s3_tcp_keepalive,
+    Config.aws_retry_mode and Config.aws_max_attempts.
+
+    Args:
+        max_pool_connections: Minimum connection pool size needed by the caller, e.g.
+            for concurrent uploads. The configured pool size is used if larger.
+    """
+    global _session  # noqa: PLW0603
+    pool_size = max(max_pool_connections or 0, CONFIG.s3_max_pool_connections)
+    with _lock:
+        if client := _s3_clients.get(pool_size):
+            return client
+        if _session is None:
+            _session = boto3.session.Session()
+        client = _session.client(
+            "s3",
+            config=BotoConfig(
+                max_pool_connections=pool_size,
+                tcp_keepalive=CONFIG.s3_tcp_keepalive,
+                retries={
+                    "mode": CONFIG.aws_retry_mode,
+                    "total_max_attempts": CONFIG.aws_max_attempts,
+                },
+            ),
+        )
+        logger.debug("Created S3 client with %s pooled connections", pool_size)
+        _s3_clients[pool_size] = client
+        return client
+
+
+def clear_client_cache() -> None:
+    """Discard the cached session and clients, e.g. after credentials change."""
+    global _session  # noqa: PLW0603
+    with _lock:
+        _session = None
+        _s3_clients.clear()
@@ -1,7 +1,10 @@
+import hashlib
 import logging
-from typing import TYPE_CHECKING
+import posixpath
+from collections.abc import Sequence
+from typing import TYPE_CHECKING, Protocol
 
-from lambdas import helpers
+from lambdas import helpers, key_index, watermarks
 from lambdas.config import Config
 
 if TYPE_CHECKING:
@@ -12,21 +15,29 @@ logger = logging.getLogger(__name__)
 CONFIG = Config()
 
 
+class ExtractOutputFile(Protocol):
+    """An extracted file to transform, e.g. helpers.S3File or alma_prep.ExtractedFile."""
+
+    @property
+    def key(self) -> str: ...  # pragma: no cover
+
+    @property
+    def size(self) -> int: ...  # pragma: no cover
+
+
 def generate_extract_command(input_payload: "InputPayload") -> dict:
     step = "extract"
     source = input_payload.source
     run_type = input_payload.run_type
-    run_date = input_payload.run_date
     raw = input_payload.raw
     bucket = CONFIG.timdex_bucket
 
-    output_prefix = helpers.generate_step_output_prefix(input_payload, step)
-    output_file = helpers.generate_step_output_filename(
-        source, "index", output_prefix, step
-    )
+    output_file = key_index.StepOutputKey.for_run(input_payload, step, "index").encode()
     s3_output = f"s3://{bucket}/{output_file}"
 
-    from_date = helpers.generate_harvest_from_date(run_date)
+    from_date = (
+        watermarks.get_harvest_from_date(input_payload) if run_type == "daily" else None
+    )
 
     cmd: list[str] = []
     if input_payload.verbose:
@@ -43,71 +54,284 @@ def generate_extract_command(input_payload: "InputPayload") -> dict:
         cmd.extend([f"--output-file={s3_output}", source.removeprefix("gis")])
 
     elif source == "mitlibwebsite":
-        cmd.append("harvest")
-
         cmd.extend(
-            [
-                f"--config-yaml-file={raw['btrix-config-yaml-file']}",
-                f"--records-output-file={s3_output}",
-            ]
+            _generate_browsertrix_harvest_options(
+                input_payload,
+                s3_output,
+                sitemaps=raw.get("btrix-sitemaps"),
+                sitemap_urls_output_file=raw.get("btrix-sitemap-urls-output-file"),
+                previous_sitemap_urls_file=raw.get("btrix-previous-sitemap-urls-file"),
+                sitemap_from_date=from_date,
+            )
         )
 
-        if sitemaps := raw.get("btrix-sitemaps"):
-            cmd.extend(f"--sitemap={s}" for s in sitemaps)
+    else:
+        cmd.extend(
+            _generate_oai_harvest_options(
+                input_payload,
+                s3_output,
+                set_spec=raw.get("oai-set-spec"),
+                from_date=from_date,
+            )
+        )
 
-        if run_type == "daily":
-            cmd.append(f"--sitemap-from-date={from_date}")
+    return {"extract-command": cmd}
 
-        if sitemap_urls_out := raw.get("btrix-sitemap-urls-output-file"):
-            cmd.append(f"--sitemap-urls-output-file={sitemap_urls_out}")
 
-        if sitemap_urls_previous := raw.get("btrix-previous-sitemap-urls-file"):
-            cmd.append(f"--previous-sitemap-urls-file={sitemap_urls_previous}")
+def generate_partitioned_extract_commands(input_payload: "InputPayload") -> dict:
+    """Generate one harvest command per partition of an extract.
 
-    else:
-        cmd.extend(
-            [
-                f"--host={raw['oai-pmh-host']}",
-                f"--output-file={s3_output}",
-                "harvest",
-            ]
+    For mitlibwebsite, input field "btrix-crawl-partitions" splits the sitemaps into
+    that many crawls, see generate_browsertrix_partitions. For OAI-PMH sources, a full
+    harvest is split by input field "oai-full-harvest-set-specs", one set per
+    partition, or "oai-full-harvest-date-windows", one record datestamp window per
+    partition. Each partition writes its own sequenced extract file, so the commands
+    can run in parallel and the transform step picks up every partition's output.
+    """
+    raw = input_payload.raw
+    if input_payload.source == "mitlibwebsite":
+        sitemap_from_date = (
+            watermarks.get_harvest_from_date(input_payload)
+            if input_payload.run_type == "daily"
+            else None
         )
+        partitions = [
+            {**partition, "sitemap_from_date": sitemap_from_date}
+            for partition in generate_browsertrix_partitions(input_payload)
+        ]
+    elif set_specs := raw.get("oai-full-harvest-set-specs"):
+        partitions = [{"set_spec": set_spec} for set_spec in set_specs]
+    else:
+        partitions = [
+            {
+                "set_spec": raw.get("oai-set-spec"),
+                "from_date": window.get("from-date"),
+                "until_date": window.get("until-date"),
+            }
+            for window in raw["oai-full-harvest-date-windows"]
+        ]
+    partitions_to_extract = []
+    for sequence, partition in enumerate(partitions, start=1):
+        output_file = key_index.StepOutputKey.for_run(
+            input_payload, "extract", "index", f"{sequence:02d}"
+        ).encode()
+        s3_output = f"s3://{CONFIG.timdex_bucket}/{output_file}"
+        cmd = ["--verbose"] if input_payload.verbose else []
+        if input_payload.source == "mitlibwebsite":
+            cmd.extend(
+                _generate_browsertrix_harvest_options(
+                    input_payload, s3_output, **partition
+                )
+            )
+        else:
+            cmd.extend(
+                _generate_oai_harvest_options(input_payload, s3_output, **partition)
+            )
+        partitions_to_extract.append({"extract-command": cmd})
+    return {"partitions-to-extract": partitions_to_extract}
 
-        if source in {"aspace", "dspace"}:
-            cmd.append("--method=get")
 
-        cmd.append(f"--metadata-format={raw['oai-metadata-format']}")
+def generate_browsertrix_partitions(input_payload: "InputPayload") -> list[dict]:
+    """Split a mitlibwebsite crawl's sitemaps into "btrix-crawl-partitions" crawls.
 
-        if run_type == "daily":
-            cmd.append(f"--from-date={from_date}")
-        elif run_type == "full":
-            cmd.append("--exclude-deleted")
+    Sitemaps are dealt round-robin, in sorted order, so crawls differ by at most one
+    sitemap and reordering "btrix-sitemaps" does not change them. Each crawl writes its
+    own sitemap URLs output file, and on daily runs reads its own previous sitemap URLs
+    file, named by adding a hash of the crawl's sitemaps to the input file names (e.g.
+    "urls.txt" to "urls_<hash>.txt"), see generate_sitemap_set_id. A crawl therefore
+    only reads URLs written by a crawl of the same sitemaps.
 
-        if set_spec := raw.get("oai-set-spec"):
-            cmd.append(f"--set-spec={set_spec}")
+    If a crawl's previous file does not exist, e.g. on the first partitioned run or
+    after the sitemaps or partition count changed, the crawl runs without one. It is
+    never given the unpartitioned previous file, whose URLs from other crawls' sitemaps
+    would be taken as removed.
+    """
+    raw = input_payload.raw
+    sitemaps = sorted(raw["btrix-sitemaps"])
+    partition_count = min(int(raw["btrix-crawl-partitions"]), len(sitemaps))
+    partitions = []
+    for number in range(partition_count):
+        partition: dict = {"sitemaps": sitemaps[number::partition_count]}
+        sitemap_set_id = generate_sitemap_set_id(partition["sitemaps"])
+        for option, field in (
+            ("sitemap_urls_output_file", "btrix-sitemap-urls-output-file"),
+            ("previous_sitemap_urls_file", "btrix-previous-sitemap-urls-file"),
+        ):
+            if uri := raw.get(field):
+                base, extension = posixpath.splitext(uri)
+                partition[option] = f"{base}_{sitemap_set_id}{extension}"
+        previous_file = partition.get("previous_sitemap_urls_file")
+        if previous_file and not helpers.s3_object_exists(previous_file):
+            logger.warning(
+                "Previous sitemap URLs file '%s' not found, crawl of sitemaps %s runs "
+                "without one",
+                previous_file,
+                partition["sitemaps"],
+            )
+            del partition["previous_sitemap_urls_file"]
+        partitions.append(partition)
+    return partitions
 
-    return {"extract-command": cmd}
+
+def generate_sitemap_set_id(sitemaps: Sequence[str]) -> str:
+    """Return a short identifier for a set of sitemaps, independent of their order."""
+    return hashlib.sha256("\n".join(sorted(sitemaps)).encode()).hexdigest()[:12]
+
+
+def _generate_browsertrix_harvest_options(
+    input_payload: "InputPayload",
+    s3_output: str,
+    *,
+    sitemaps: list[str] | None = None,
+    sitemap_urls_output_file: str | None = None,
+    previous_sitemap_urls_file: str | None = None,
+    sitemap_from_date: str | None = None,
+) -> list[str]:
+    cmd = [
+        "harvest",
+        f"--config-yaml-file={input_payload.raw['btrix-config-yaml-file']}",
+        f"--records-output-file={s3_output}",
+    ]
+
+    if sitemaps:
+        cmd.extend(f"--sitemap={s}" for s in sitemaps)
+
+    if sitemap_from_date:
+        cmd.append(f"--sitemap-from-date={sitemap_from_date}")
+
+    if sitemap_urls_output_file:
+        cmd.append(f"--sitemap-urls-output-file={sitemap_urls_output_file}")
+
+    if previous_sitemap_urls_file:
+        cmd.append(f"--previous-sitemap-urls-file={previous_sitemap_urls_file}")
+    return cmd
+
+
+def _generate_oai_harvest_options(
+    input_payload: "InputPayload",
+    s3_output: str,
+    set_spec: str | None = None,
+    from_date: str | None = None,
+    until_date: str | None = None,
+) -> list[str]:
+    raw = input_payload.raw
+    cmd = [
+        f"--host={raw['oai-pmh-host']}",
+        f"--output-file={s3_output}",
+        "harvest",
+    ]
+
+    if input_payload.source in {"aspace", "dspace"}:
+        cmd.append("--method=get")
+
+    cmd.append(f"--metadata-format={raw['oai-metadata-format']}")
+
+    if from_date:
+        cmd.append(f"--from-date={from_date}")
+    if until_date:
+        cmd.append(f"--until-date={until_date}")
+    if input_payload.run_type == "full":
+        cmd.append("--exclude-deleted")
+
+    if set_spec:
+        cmd.append(f"--set-spec={set_spec}")
+    return cmd
+
+
+def plan_transform_tasks(
+    extract_output_files: Sequence[ExtractOutputFile], target_size: int | None
+) -> list[list[ExtractOutputFile]]:
+    """Group extract output files into transform tasks of about target_size bytes.
+
+    Files are packed first-fit, largest first, into tasks whose total size does not
+    exceed the target, so many small files share one task while a file at or over the
+    target gets a task of its own. Index and delete files are never grouped together.
+    Files keep key order within a task, and tasks are ordered by their first key.
+
+    If no target size is given, each file gets its own task.
+    """
+    if target_size is None:
+        return [[extract_output_file] for extract_output_file in extract_output_files]
+    tasks: list[list[ExtractOutputFile]] = []
+    task_sizes: list[int] = []
+    task_load_types: list[str | None] = []
+    for extract_output_file in sorted(
+        extract_output_files, key=lambda extract_output_file: -extract_output_file.size
+    ):
+        step_output_key = key_index.StepOutputKey.decode(extract_output_file.key)
+        load_type = step_output_key.load_type if step_output_key else None
+        for task_number, task in enumerate(tasks):
+            if (
+                task_load_types[task_number] == load_type
+                and task_sizes[task_number] + extract_output_file.size <= target_size
+            ):
+                task.append(extract_output_file)
+                task_sizes[task_number] += extract_output_file.size
+                break
+        else:
+            tasks.append([extract_output_file])
+            task_sizes.append(extract_output_file.size)
+            task_load_types.append(load_type)
+    for task in tasks:
+        task.sort(key=lambda extract_output_file: extract_output_file.key)
+    return sorted(tasks, key=lambda task: task[0].key)
 
 
 def generate_transform_commands(
     input_payload: "InputPayload",
-    extract_output_files: list[str],
+    extract_output_files: Sequence[ExtractOutputFile],
 ) -> dict[str, list[dict]]:
-    """Generate task run command for TIMDEX transform."""
+    """Generate task run command for TIMDEX transform.
+
+    Extract output files are passed in as already known to the caller, either from a
+    listing of the TIMDEX bucket or from the files Alma prep wrote, so no further S3
+    requests are needed here.
+
+    By default each file is transformed by its own task. If env var
+    TRANSFORM_TASK_TARGET_SIZE_MB is set, files are grouped by plan_transform_tasks
+    into multi-input commands with one --input-file per file, and each task reports its
+    total "input-bytes". A task whose single file exceeds the target is flagged
+    "oversized", as a candidate for splitting, e.g. via Alma prep sharding.
+    """
+    target_size = CONFIG.transform_task_target_size
     files_to_transform: list[dict] = []
-    for extract_output_file in extract_output_files:
+    for task in plan_transform_tasks(extract_output_files, target_size):
         transform_command = [
-            f"--input-file=s3://{CONFIG.timdex_bucket}/{extract_output_file}",
-            f"--output-location={CONFIG.s3_timdex_dataset_location}",
-            f"--source={input_payload.source}",
-            f"--run-id={input_payload.run_id}",
-            f"--run-timestamp={input_payload.run_timestamp}",
+            f"--input-file=s3://{CONFIG.timdex_bucket}/{extract_output_file.key}"
+            for extract_output_file in task
         ]
+        transform_command.extend(
+            [
+                f"--output-location={CONFIG.s3_timdex_dataset_location}",
+                f"--source={input_payload.source}",
+                f"--run-id={input_payload.run_id}",
+                f"--run-timestamp={input_payload.run_timestamp}",
+            ]
+        )
         if input_payload.source in CONFIG.source_exclusion_lists:
             transform_command.append(
                 f"--exclusion-list-path={CONFIG.source_exclusion_lists[input_payload.source]}"
             )
-        files_to_transform.append({"transform-command": transform_command})
+        file_to_transform: dict = {"transform-command": transform_command}
+        if target_size is not None:
+            input_bytes = sum(extract_output_file.size for extract_output_file in task)
+            file_to_transform["input-bytes"] = input_bytes
+            if input_bytes > target_size:
+                file_to_transform["oversized"] = True
+                logger.warning(
+                    "Extract file '%s' (%s bytes) exceeds the transform task target "
+                    "size of %s bytes",
+                    task[0].key,
+                    input_bytes,
+                    target_size,
+                )
+        files_to_transform.append(file_to_transform)
+    if target_size is not None:
+        logger.info(
+            "Planned %s transform tasks for %s extract files",
+            len(files_to_transform),
+            len(extract_output_files),
+        )
     return {"files-to-transform": files_to_transform}
 
 
@@ -1,6 +1,8 @@
 import logging
 import os
-from typing import Any, ClassVar
+from typing import Any, ClassVar, Literal, cast
+
+AWSRetryMode = Literal["legacy", "standard", "adaptive"]
 
 
 class Config:
@@ -9,8 +11,24 @@ class Config:
         "TIMDEX_S3_EXTRACT_BUCKET_ID",
         "WORKSPACE",
     )
-    OPTIONAL_ENV_VARS = ()
+    OPTIONAL_ENV_VARS = (
+        "ALMA_PREP_MAX_WORKERS",
+        "ALMA_PREP_SHARD_MAX_RECORDS",
+        "ALMA_PREP_SHARD_MAX_SIZE_MB",
+        "ALMA_PREP_TIME_RESERVE_SECONDS",
+        "ALMA_PREP_UPLOAD_MAX_IN_FLIGHT",
+        "ALMA_PREP_UPLOAD_PART_SIZE_MB",
+        "AWS_LAMBDA_FUNCTION_MEMORY_SIZE",
+        "AWS_MAX_ATTEMPTS",
+        "AWS_RETRY_MODE",
+        "S3_KEY_INDEX_TTL_SECONDS",
+        "S3_LIST_MAX_WORKERS",
+        "S3_MAX_POOL_CONNECTIONS",
+        "S3_TCP_KEEPALIVE",
+        "TRANSFORM_TASK_TARGET_SIZE_MB",
+    )
 
+    ALMA_PREP_PIPE_BUFFERS = 2
     GIS_SOURCES = ("gismit", "gisogm")
     INDEX_ALIASES: ClassVar = {
         "geo": GIS_SOURCES,
@@ -34,6 +52,10 @@ class Config:
     }
     REQUIRED_FIELDS = ("next-step", "run-date", "run-type", "source")
     REQUIRED_OAI_HARVEST_FIELDS = ("oai-pmh-host", "oai-metadata-format")
+    OAI_FULL_HARVEST_PARTITION_FIELDS = (
+        "oai-full-harvest-set-specs",
+        "oai-full-harvest-date-windows",
+    )
     REQUIRED_BTRIX_HARVEST_FIELDS = (
         "btrix-config-yaml-file",
         "btrix-sitemaps",
@@ -42,7 +64,7 @@ class Config:
     SOURCE_EXCLUSION_LISTS: ClassVar = {"libguides": "/config/libguides/exclusions.csv"}
     VALID_DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%SZ")
     VALID_RUN_TYPES = ("full", "daily")
-    VALID_STEPS = ("extract", "transform", "load")
+    VALID_STEPS = ("extract", "transform", "load", "finish", "backfill")
 
     def __getattr__(self, name: str) -> Any:  # noqa: ANN401
         """Provide dot notation access to configurations and env vars on this class."""
@@ -81,6 +103,117 @@ class Config:
             raise OSError(f"Env var '{var}' must be defined")
         return value
 
+    @property
+    def alma_prep_max_workers(self) -> int:
+        """Return the number of Alma export files to extract concurrently."""
+        var = "ALMA_PREP_MAX_WORKERS"
+        value = int(os.getenv(var, "1"))
+        if value < 1:
+            raise OSError(f"Env var '{var}' must be a positive integer")
+        return value
+
+    @property
+    def alma_prep_upload_part_size(self) -> int:
+        """Return the multipart upload part size, in bytes, for extracted Alma files."""
+        var = "ALMA_PREP_UPLOAD_PART_SIZE_MB"
+        value = int(os.getenv(var, "8"))
+        if value < 5:  # noqa: PLR2004
+            raise OSError(f"Env var '{var}' must be at least 5 (S3 minimum part size)")
+        return value * 1024 * 1024
+
+    @property
+    def alma_prep_upload_max_in_flight(self) -> int:
+        """Return the number of multipart parts to upload concurrently per Alma file.
+
+        The configured value is capped so that the part-sized buffers of all concurrent
+        Alma file extractions stay within half of the Lambda memory size, when known.
+        Each extraction holds its parts in flight, the part being filled, and the
+        ALMA_PREP_PIPE_BUFFERS + 1 read buffers of alma_prep.pipe_file_contents.
+        """
+        var = "ALMA_PREP_UPLOAD_MAX_IN_FLIGHT"
+        value = int(os.getenv(var, "4"))
+        if value < 1:
+            raise OSError(f"Env var '{var}' must be a positive integer")
+        if memory_size := os.getenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE"):
+            memory_ceiling = int(memory_size) * 1024 * 1024 // 2
+            buffers_per_file = memory_ceiling // (
+                self.alma_prep_max_workers * self.alma_prep_upload_part_size
+            )
+            max_in_flight = buffers_per_file - 1 - (self.ALMA_PREP_PIPE_BUFFERS + 1)
+            if max_in_flight < 1:
+                message = (
+                    "Alma prep buffers for ALMA_PREP_MAX_WORKERS concurrent files of "
+                    "ALMA_PREP_UPLOAD_PART_SIZE_MB parts exceed half of the Lambda "
+                    "memory size, reduce either env var"
+                )
+                raise OSError(message)
+            value = min(value, max_in_flight)
+        return value
+
+    @property
+    def alma_prep_shard_max_size(self) -> int | None:
+        """Return the target size, in bytes, of sharded Alma extract files, if set."""
+        if value := os.getenv("ALMA_PREP_SHARD_MAX_SIZE_MB"):
+            return int(value) * 1024 * 1024
+        return None
+
+    @property
+    def alma_prep_shard_max_records(self) -> int | None:
+        """Return the target record count of sharded Alma extract files, if set."""
+        if value := os.getenv("ALMA_PREP_SHARD_MAX_RECORDS"):
+            return int(value)
+        return None
+
+    @property
+    def alma_prep_time_reserve_seconds(self) -> int:
+        """Return the seconds of Lambda run time to keep in reserve during Alma prep."""
+        return int(os.getenv("ALMA_PREP_TIME_RESERVE_SECONDS", "60"))
+
+    @property
+    def transform_task_target_size(self) -> int | None:
+        """Return the target input size, in bytes, of a transform task, if set."""
+        if value := os.getenv("TRANSFORM_TASK_TARGET_SIZE_MB"):
+            return int(value) * 1024 * 1024
+        return None
+
+    @property
+    def s3_key_index_ttl_seconds(self) -> float:
+        """Return how long a cached S3 step output index may be reused, in seconds."""
+        return float(os.getenv("S3_KEY_INDEX_TTL_SECONDS", "60"))
+
+    @property
+    def s3_list_max_workers(self) -> int:
+        """Return the number of S3 listing partitions to list concurrently."""
+        var = "S3_LIST_MAX_WORKERS"
+        value = int(os.getenv(var, "8"))
+        if value < 1:
+            raise OSError(f"Env var '{var}' must be a positive integer")
+        return value
+
+    @property
+    def s3_max_pool_connections(self) -> int:
+        """Return the minimum connection pool size for S3 clients."""
+        return int(os.getenv("S3_MAX_POOL_CONNECTIONS", "10"))
+
+    @property
+    def s3_tcp_keepalive(self) -> bool:
+        """Return whether S3 clients use TCP keepalive on pooled connections."""
+        return os.getenv("S3_TCP_KEEPALIVE", "true").lower() == "true"
+
+    @property
+    def aws_retry_mode(self) -> AWSRetryMode:
+        """Return the botocore retry mode for AWS clients."""
+        var = "AWS_RETRY_MODE"
+        value = os.getenv(var, "adaptive")
+        if value not in ("legacy", "standard", "adaptive"):
+            raise OSError(f"Env var '{var}' must be one of: legacy, standard, adaptive")
+        return cast("AWSRetryMode", value)
+
+    @property
+    def aws_max_attempts(self) -> int:
+        """Return the maximum request attempts, including the first, for AWS clients."""
+        return int(os.getenv("AWS_MAX_ATTEMPTS", "5"))
+
     @property
     def s3_timdex_dataset_location(self) -> str:
         """Return full S3 URI (bucket + prefix) of dataset root location."""
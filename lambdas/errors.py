@@ -1,2 +1,6 @@
 class NoFilesError(Exception):
     """Custom error raised when files with a given prefix are not present in S3."""
+
+
+class InvalidXMLError(Exception):
+    """Custom error raised when an extracted XML file is not well-formed."""
@@ -1,18 +1,33 @@
 import json
 import logging
+import time
 import uuid
 from dataclasses import asdict, dataclass
 from datetime import UTC, datetime
-from typing import Literal
+from typing import TYPE_CHECKING, Literal
 
-from lambdas import alma_prep, commands, errors, helpers
+from lambdas import (
+    alma_prep,
+    commands,
+    errors,
+    helpers,
+    key_index,
+    run_summary,
+    sitemap_diff,
+    watermarks,
+)
 from lambdas.config import Config, configure_logger
 
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
 logger = logging.getLogger(__name__)
 
 CONFIG = Config()
 
-type NextStep = Literal["extract", "transform", "load", "exit-ok", "exit-error", "end"]
+type NextStep = Literal[
+    "extract", "transform", "load", "finish", "backfill", "exit-ok", "exit-error", "end"
+]
 
 
 @dataclass
@@ -25,6 +40,7 @@ class InputPayload:
     run_timestamp: str
     raw: dict
     verbose: bool = True
+    continuation_token: str | None = None
 
     @staticmethod
     def validate_input(input_data: dict) -> None:
@@ -60,8 +76,11 @@ class InputPayload:
             )
             raise ValueError(message)
 
+        if next_step == "backfill":
+            InputPayload.validate_backfill(input_data)
+
         # If next step is extract step, required harvest fields are present
-        if input_data["next-step"] == "extract":
+        if input_data["next-step"] in ("extract", "backfill"):
             missing_harvest_fields = None
             if input_data["source"] in CONFIG.GIS_SOURCES:
                 pass  # Currently no specific GeoHarvester requirements
@@ -69,6 +88,22 @@ class InputPayload:
                 missing_harvest_fields = set(
                     CONFIG.REQUIRED_BTRIX_HARVEST_FIELDS
                 ).difference(set(input_data.keys()))
+                if "btrix-crawl-partitions" in input_data and (
+                    not isinstance(input_data["btrix-crawl-partitions"], int)
+                    or input_data["btrix-crawl-partitions"] < 1
+                ):
+                    message = "Field 'btrix-crawl-partitions' must be a positive integer"
+                    raise ValueError(message)
+                if (
+                    input_data["run-type"] == "daily"
+                    and "btrix-current-sitemap-urls-file" in input_data
+                    and "btrix-crawl-partitions" in input_data
+                ):
+                    message = (
+                        "Field 'btrix-crawl-partitions' cannot be used with "
+                        "'btrix-current-sitemap-urls-file' when 'run-type=daily'"
+                    )
+                    raise ValueError(message)
                 # require previous sitemaps URLs argument for daily runs
                 if (
                     input_data["run-type"] == "daily"
@@ -83,6 +118,7 @@ class InputPayload:
                 missing_harvest_fields = set(
                     CONFIG.REQUIRED_OAI_HARVEST_FIELDS
                 ).difference(set(input_data.keys()))
+                InputPayload.validate_oai_full_harvest_partitions(input_data)
 
             if missing_harvest_fields:
                 message = (
@@ -91,6 +127,64 @@ class InputPayload:
                 )
                 raise ValueError(message)
 
+    @staticmethod
+    def validate_backfill(input_data: dict) -> None:
+        """Validate fields of a backfill, which collapses missed daily runs into one."""
+        if input_data["run-type"] != "daily":
+            message = "Input 'run-type' must be 'daily' when 'next-step=backfill'"
+            raise ValueError(message)
+        if input_data["source"] == "alma":
+            message = (
+                "Backfill is not supported for source 'alma', Alma exports are "
+                "prepared one run date at a time"
+            )
+            raise ValueError(message)
+        if "backfill-start-date" not in input_data:
+            message = "Field 'backfill-start-date' required when 'next-step=backfill'"
+            raise ValueError(message)
+        try:
+            start_date = helpers.format_run_date(input_data["backfill-start-date"])
+        except ValueError:
+            message = (
+                "Input 'backfill-start-date' value must be one of the following date "
+                f"string formats: {CONFIG.VALID_DATE_FORMATS}. Value provided was "
+                f"'{input_data['backfill-start-date']}'"
+            )
+            raise ValueError(message) from None
+        if start_date > helpers.format_run_date(input_data["run-date"]):
+            message = "Input 'backfill-start-date' must not be after 'run-date'"
+            raise ValueError(message)
+
+    @staticmethod
+    def validate_oai_full_harvest_partitions(input_data: dict) -> None:
+        """Validate optional fields that partition a full OAI-PMH harvest."""
+        partition_fields = [
+            field
+            for field in CONFIG.OAI_FULL_HARVEST_PARTITION_FIELDS
+            if field in input_data
+        ]
+        if len(partition_fields) > 1:
+            message = (
+                "Input may include only one of the harvest partition fields "
+                f"{list(CONFIG.OAI_FULL_HARVEST_PARTITION_FIELDS)}"
+            )
+            raise ValueError(message)
+        for field in partition_fields:
+            partitions = input_data[field]
+            if not isinstance(partitions, list) or not partitions:
+                message = f"Field '{field}' must be a non-empty list"
+                raise ValueError(message)
+        for window in input_data.get("oai-full-harvest-date-windows", []):
+            if not isinstance(window, dict) or not set(window).issubset(
+                {"from-date", "until-date"}
+            ):
+                message = (
+                    "Field 'oai-full-harvest-date-windows' items must be objects with "
+                    "optional 'from-date' and 'until-date'. "
+                    f"Value provided was '{window}'"
+                )
+                raise ValueError(message)
+
     @classmethod
     def from_event(cls, event: dict) -> "InputPayload":
         # extract verbosity and debug log the payload
@@ -110,6 +204,7 @@ class InputPayload:
             run_timestamp=event.get("run-timestamp", datetime.now(UTC).isoformat()),
             raw=event,
             verbose=verbose,
+            continuation_token=event.get("continuation-token"),
         )
 
 
@@ -126,7 +221,9 @@ class ResultPayload:
     extract: dict | None = None
     transform: dict | None = None
     load: dict | None = None
+    backfill: dict | None = None
     message: str | None = None
+    continuation_token: str | None = None
 
     @classmethod
     def from_input_payload(cls, input_payload: "InputPayload") -> "ResultPayload":
@@ -142,7 +239,7 @@ class ResultPayload:
         return {k.replace("_", "-"): v for k, v in asdict(self).items() if v is not None}
 
 
-def lambda_handler(event: dict, _context: dict) -> dict:
+def lambda_handler(event: dict, context: dict) -> dict:
     """Format data into the necessary input for TIMDEX pipeline processing."""
     # validate and parse input payload
     input_payload = InputPayload.from_event(event)
@@ -153,15 +250,31 @@ def lambda_handler(event: dict, _context: dict) -> dict:
     if input_payload.next_step == "extract":
         result = handle_extract(input_payload, result)
     elif input_payload.next_step == "transform":
-        result = handle_transform(input_payload, result)
+        result = handle_transform(input_payload, result, get_deadline(context))
     elif input_payload.next_step == "load":
         result = handle_load(input_payload, result)
+    elif input_payload.next_step == "finish":
+        result = handle_finish(input_payload, result)
+    elif input_payload.next_step == "backfill":
+        result = handle_backfill(input_payload, result)
     else:
         raise ValueError(f"'next-step' not supported: '{input_payload.next_step}'")
 
     return result.to_dict()
 
 
+def get_deadline(context: object) -> float | None:
+    """Get the time.monotonic() time at which this Lambda invocation will time out.
+
+    Returns None if the context does not provide the remaining invocation time, e.g.
+    when the handler is called directly.
+    """
+    get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+    if get_remaining_time is None:
+        return None
+    return time.monotonic() + get_remaining_time() / 1000
+
+
 def handle_extract(input_payload: InputPayload, result: ResultPayload) -> ResultPayload:
     result.next_step = "transform"
     if input_payload.source in CONFIG.GIS_SOURCES:
@@ -170,22 +283,103 @@ def handle_extract(input_payload: InputPayload, result: ResultPayload) -> Result
         result.harvester_type = "browsertrix"
     else:
         result.harvester_type = "oai"
-    result.extract = commands.generate_extract_command(input_payload)
+    if (
+        result.harvester_type == "oai"
+        and input_payload.run_type == "full"
+        and any(
+            field in input_payload.raw
+            for field in CONFIG.OAI_FULL_HARVEST_PARTITION_FIELDS
+        )
+    ) or (
+        result.harvester_type == "browsertrix"
+        and "btrix-crawl-partitions" in input_payload.raw
+    ):
+        result.extract = commands.generate_partitioned_extract_commands(input_payload)
+    else:
+        diff = (
+            sitemap_diff.create_sitemap_diff(input_payload)
+            if sitemap_diff.uses_sitemap_diff(input_payload)
+            else None
+        )
+        if diff and not diff.has_changes:
+            result.next_step = "exit-ok"
+            result.success = True  # NOTE: to be removed after StepFunction updates
+            message = "There were no daily new/updated/deleted sitemap URLs to crawl."
+            logger.info(message)
+            result.message = message
+            return result
+        result.extract = commands.generate_extract_command(input_payload)
+        if diff:
+            result.extract["sitemap-diff"] = diff.to_payload()
+    return result
+
+
+def handle_backfill(input_payload: InputPayload, result: ResultPayload) -> ResultPayload:
+    """Plan one daily run covering every run date from "backfill-start-date".
+
+    Instead of replaying each missed daily run, a single extract harvests from the
+    start date's harvest from date, see watermarks.get_harvest_from_date, and the run
+    continues as a daily run for the input "run-date", so its files are transformed and
+    loaded once.
+    """
+    result = handle_extract(input_payload, result)
+    start_date = helpers.format_run_date(input_payload.raw["backfill-start-date"])
+    run_dates = (
+        datetime.strptime(input_payload.run_date, "%Y-%m-%d").astimezone(UTC)
+        - datetime.strptime(start_date, "%Y-%m-%d").astimezone(UTC)
+    ).days + 1
+    result.backfill = {
+        "start-date": start_date,
+        "end-date": input_payload.run_date,
+        "run-dates": run_dates,
+    }
+    logger.info(
+        "Backfilling %s daily runs of source '%s' from '%s' to '%s' as one run",
+        run_dates,
+        input_payload.source,
+        start_date,
+        input_payload.run_date,
+    )
     return result
 
 
-def handle_transform(input_payload: InputPayload, result: ResultPayload) -> ResultPayload:
+def handle_transform(
+    input_payload: InputPayload,
+    result: ResultPayload,
+    deadline: float | None = None,
+) -> ResultPayload:
     result.next_step = "load"
+    prep_result = None
     try:
         if input_payload.source == "alma":
-            alma_prep.prepare_alma_export_files(input_payload)
-        extract_output_files = helpers.list_s3_files_by_prefix(
-            CONFIG.timdex_bucket,
-            helpers.generate_step_output_prefix(
-                input_payload,
-                "extract",
-            ),
-        )
+            prep_result = alma_prep.prepare_alma_export_files(input_payload, deadline)
+            if prep_result.remaining_export_files:
+                result.next_step = "transform"
+                result.continuation_token = alma_prep.encode_continuation_token(
+                    prep_result.remaining_export_files
+                )
+                message = (
+                    f"{len(prep_result.remaining_export_files)} Alma export files left "
+                    "to extract before the Lambda timeout, continue with the returned "
+                    "'continuation-token'."
+                )
+                result.message = message
+                logger.warning(message)
+                return result
+            # the files prep wrote are known exactly, so the bucket is not listed again
+            extract_output_files: Sequence[commands.ExtractOutputFile] = (
+                prep_result.extracted_files
+            )
+        else:
+            extract_output_files = key_index.list_step_output_files(
+                input_payload, "extract"
+            )
+    except errors.InvalidXMLError as error:
+        result.next_step = "exit-error"
+        result.failure = True  # NOTE: to be removed after StepFunction updates
+        result.message = str(error)
+        logger.error(result.message)  # noqa: TRY400
+        return result
     except errors.NoFilesError:
         if input_payload.source == "alma" or input_payload.run_type == "full":
             result.next_step = "exit-error"
@@ -202,23 +396,33 @@ def handle_transform(input_payload: InputPayload, result: ResultPayload) -> Resu
             message = "There were no daily new/updated/deleted records to harvest."
             logger.info(message)
             result.message = message
+            watermarks.update_harvest_watermark(input_payload)
         return result
     logger.info(
-        "%s extracted files found in TIMDEX S3 bucket for date '%s' and source '%s'",
+        "%s extracted files (%s bytes) found in TIMDEX S3 bucket for date '%s' and "
+        "source '%s'",
         len(extract_output_files),
+        sum(extract_output_file.size for extract_output_file in extract_output_files),
         input_payload.run_date,
         input_payload.source,
     )
-    result.transform = commands.generate_transform_commands(
+    transform: dict = commands.generate_transform_commands(
         input_payload,
         extract_output_files,
     )
+    if prep_result:
+        transform["extract-summary"] = alma_prep.summarize_extracted_files(
+            prep_result.extracted_files
+        )
+    result.transform = transform
     return result
 
 
 def handle_load(input_payload: InputPayload, result: ResultPayload) -> ResultPayload:
-    result.next_step = "end"
-    if not helpers.dataset_records_exist_for_run(input_payload.run_id):
+    result.next_step = "finish"
+    summary = run_summary.get_run_summary(input_payload)
+    record_counts = summary.record_counts
+    if not record_counts.to_load:
         result.next_step = "exit-ok"
         result.success = True  # NOTE: to be removed after StepFunction updates
         message = (
@@ -227,6 +431,21 @@ def handle_load(input_payload: InputPayload, result: ResultPayload) -> ResultPay
         )
         logger.warning(message)
         result.message = message
+        watermarks.update_harvest_watermark(input_payload)
         return result
+    logger.info(
+        "Found %s records to index and %s records to delete for run_id '%s'",
+        record_counts.index,
+        record_counts.delete,
+        input_payload.run_id,
+    )
     result.load = commands.generate_load_commands(input_payload)
+    result.load["run-summary"] = summary.to_payload()
+    return result
+
+
+def handle_finish(input_payload: InputPayload, result: ResultPayload) -> ResultPayload:
+    """Record a run whose load succeeded as its source's harvest watermark."""
+    result.next_step = "end"
+    watermarks.update_harvest_watermark(input_payload)
     return result
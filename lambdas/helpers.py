@@ -1,23 +1,47 @@
-# ruff: noqa: S608
-
 import contextlib
+import hashlib
+import json
 import logging
+import string
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import UTC, datetime, timedelta
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 
-import boto3
-from timdex_dataset_api.dataset import TIMDEXDataset  # type: ignore[import-untyped]
+from botocore.exceptions import ClientError
 
-from lambdas import errors
+from lambdas import clients, errors
 from lambdas.config import Config
 
 if TYPE_CHECKING:
+    from mypy_boto3_s3.client import S3Client  # pragma: no cover
+    from mypy_boto3_s3.type_defs import (  # pragma: no cover
+        ListObjectsV2RequestPaginateTypeDef,
+        ObjectTypeDef,
+    )
+    from timdex_dataset_api.dataset import TIMDEXDataset  # type: ignore[import-untyped]
+
     from lambdas.format_input import InputPayload
 
 logger = logging.getLogger(__name__)
 
 CONFIG = Config()
 
+# ListObjectsV2 page size, the S3 maximum
+S3_LIST_PAGE_SIZE = 1000
+
+# points at which to split a listing of a large step output prefix, see
+# list_s3_objects_by_prefix; sequenced index files are split by first sequence digit
+STEP_OUTPUT_FILE_PARTITIONS = (
+    "-to-delete",
+    "-to-index.",
+    *(f"-to-index_{digit}" for digit in string.digits),
+)
+
+# TIMDEXDataset handles by dataset location, with the metadata version each was loaded at
+_timdex_datasets: dict[str, tuple[str, "TIMDEXDataset"]] = {}
+
 
 def format_run_date(input_date: str) -> str:
     """Format an input date string into a TIMDEX date string.
@@ -51,91 +75,289 @@ def generate_index_name(source: str) -> str:
     return f"{source}-{datetime.now(tz=UTC).strftime('%Y-%m-%dt%H-%M-%S')}"
 
 
-def generate_step_output_filename(
-    source: str,
-    load_type: str,
+@dataclass(frozen=True, slots=True)
+class S3File:
+    """An S3 object as returned by a ListObjectsV2 request."""
+
+    key: str
+    size: int
+    etag: str
+    last_modified: datetime
+
+    @classmethod
+    def from_list_object(cls, s3_object: "ObjectTypeDef") -> "S3File":
+        return cls(
+            key=s3_object["Key"],
+            size=s3_object["Size"],
+            etag=s3_object["ETag"],
+            last_modified=s3_object["LastModified"],
+        )
+
+
+def list_s3_objects_by_prefix(
+    bucket: str,
     prefix: str,
-    step: str,
-    sequence: str | None = None,
-) -> str:
-    """Generate a full TIMDEX file name as used for pipeline files in S3.
+    partitions: Sequence[str] | None = None,
+    *,
+    allow_empty: bool = False,
+) -> list[S3File]:
+    """List all files with the provided prefix in the provided bucket.
+
+    Files are listed page by page. If partitions are provided and the first page comes
+    back truncated, the rest of the prefix is instead listed concurrently (see
+    Config.s3_list_max_workers), one sub-prefix prefix + partition at a time. Keys
+    between or after the partitions are found by a one-key probe after each partition
+    and listed too, so partitions only decide how the listing is split, never which
+    keys are listed. Files are always returned sorted by key, the same order as a
+    single listing.
 
-    Given a filename prefix, load type (index or delete), step (extract, transform, or
-    load), and optional file sequence number, generate a full file name.
+    Raises:
+        errors.NoFilesError: No files were found, unless `allow_empty` is True.
     """
-    sequence_suffix = f"_{sequence}" if sequence else ""
-    if step == "extract":
-        file_type = (
-            "jsonl"
-            if (source in CONFIG.GIS_SOURCES or source == "mitlibwebsite")
-            else "xml"
-        )
-    elif load_type == "delete":
-        file_type = "txt"
+    s3_client = clients.get_s3_client(max_pool_connections=CONFIG.s3_list_max_workers)
+    if not partitions:
+        s3_files = _list_s3_objects(s3_client, bucket, prefix)
     else:
-        file_type = "json"
-    return f"{prefix}-to-{load_type}{sequence_suffix}.{file_type}"
+        first_page = s3_client.list_objects_v2(
+            Bucket=bucket, Prefix=prefix, MaxKeys=S3_LIST_PAGE_SIZE
+        )
+        s3_files = [
+            S3File.from_list_object(s3_object)
+            for s3_object in first_page.get("Contents", [])
+        ]
+        if first_page.get("IsTruncated"):
+            s3_files.extend(
+                _list_s3_object_partitions(
+                    s3_client, bucket, prefix, s3_files[-1].key, partitions
+                )
+            )
+    if not s3_files and not allow_empty:
+        logger.error(
+            "No files retrieved from bucket '%s' with prefix '%s'", bucket, prefix
+        )
+        raise errors.NoFilesError
+    return s3_files
 
 
-def generate_step_output_prefix(input_payload: "InputPayload", step: str) -> str:
-    """Generate a TIMDEX file prefix as used for pipeline files in S3.
+def _list_s3_object_partitions(
+    s3_client: "S3Client",
+    bucket: str,
+    prefix: str,
+    start_after: str,
+    partitions: Sequence[str],
+) -> list[S3File]:
+    # sub-prefixes still to list, without any nested in another or wholly listed
+    # already, i.e. sorting before start_after without being a prefix of it
+    sub_prefixes: list[str] = []
+    for sub_prefix in sorted({prefix + partition for partition in partitions}):
+        if (sub_prefixes and sub_prefix.startswith(sub_prefixes[-1])) or (
+            sub_prefix < start_after and not start_after.startswith(sub_prefix)
+        ):
+            continue
+        sub_prefixes.append(sub_prefix)
 
-    Given a source, date string, run type (daily or full), and step (extract,
-    transform, or harvest), generate a file prefix.
-    """
-    return (
-        f"{input_payload.source}/{input_payload.source}-{input_payload.run_date}-"
-        f"{input_payload.run_type}-{step}ed-records"
+    def list_partition(number: int) -> list[S3File]:
+        # list a sub-prefix, then any keys between it and the next sub-prefix; number
+        # -1 lists only the keys between start_after and the first sub-prefix
+        end_before = sub_prefixes[number + 1] if number + 1 < len(sub_prefixes) else None
+        if number < 0:
+            s3_files = []
+            gap_start_after = start_after
+        else:
+            sub_prefix = sub_prefixes[number]
+            s3_files = _list_s3_objects(
+                s3_client,
+                bucket,
+                sub_prefix,
+                start_after if start_after.startswith(sub_prefix) else None,
+            )
+            gap_start_after = (
+                s3_files[-1].key if s3_files else max(sub_prefix, start_after)
+            )
+        probe = s3_client.list_objects_v2(
+            Bucket=bucket, Prefix=prefix, StartAfter=gap_start_after, MaxKeys=1
+        )
+        if (next_keys := probe.get("Contents")) and (
+            end_before is None or next_keys[0]["Key"] < end_before
+        ):
+            s3_files.extend(
+                _list_s3_objects(s3_client, bucket, prefix, gap_start_after, end_before)
+            )
+        return s3_files
+
+    with ThreadPoolExecutor(
+        max_workers=min(CONFIG.s3_list_max_workers, len(sub_prefixes) + 1),
+        thread_name_prefix="s3-list",
+    ) as executor:
+        partition_files = executor.map(list_partition, range(-1, len(sub_prefixes)))
+        return [s3_file for s3_files in partition_files for s3_file in s3_files]
+
+
+def _list_s3_objects(
+    s3_client: "S3Client",
+    bucket: str,
+    prefix: str,
+    start_after: str | None = None,
+    end_before: str | None = None,
+) -> list[S3File]:
+    request: ListObjectsV2RequestPaginateTypeDef = {
+        "Bucket": bucket,
+        "Prefix": prefix,
+        "PaginationConfig": {"PageSize": S3_LIST_PAGE_SIZE},
+    }
+    if start_after:
+        request["StartAfter"] = start_after
+    pages = s3_client.get_paginator("list_objects_v2").paginate(**request)
+    s3_files: list[S3File] = []
+    for page in pages:
+        for s3_object in page.get("Contents", []):
+            if end_before is not None and s3_object["Key"] >= end_before:
+                return s3_files
+            s3_files.append(S3File.from_list_object(s3_object))
+    return s3_files
+
+
+def s3_object_exists(uri: str) -> bool:
+    """Return whether an object exists at an S3 URI, e.g. "s3://bucket/key"."""
+    bucket, _, key = uri.removeprefix("s3://").partition("/")
+    try:
+        clients.get_s3_client().head_object(Bucket=bucket, Key=key)
+    except ClientError as error:
+        if error.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return False
+        raise
+    return True
+
+
+def read_json_object(
+    s3_client: "S3Client", bucket: str, key: str
+) -> Any | None:  # noqa: ANN401
+    """Return the decoded JSON object at an S3 key, or None if the key does not exist."""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(response["Body"].read())
+
+
+def write_json_object(
+    s3_client: "S3Client",
+    bucket: str,
+    key: str,
+    value: Any,  # noqa: ANN401
+) -> None:
+    """Write a value to an S3 key as a JSON object."""
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(value).encode(),
+        ContentType="application/json",
     )
 
 
-def get_load_type_and_sequence_from_timdex_filename(
-    file_name: str,
-) -> tuple[str, str | None]:
-    """Given a TIMDEX file name, return the load type and optional sequence number.
+@dataclass
+class RunRecordCounts:
+    """Counts of TIMDEX dataset records for an ETL run, by record action."""
+
+    index: int = 0
+    delete: int = 0
+    skip: int = 0
+    error: int = 0
+
+    @property
+    def to_load(self) -> int:
+        """Return the number of records to index or delete."""
+        return self.index + self.delete
+
 
-    Returns:
-        load_type: one of: index, delete
-        sequence: zero-padded two digit file sequence number if present, otherwise None
+def _run_query_parameters(input_payload: "InputPayload") -> dict[str, str]:
+    # source and run_date are dataset partition columns, so filtering on them lets
+    # DuckDB skip the metadata of all other sources and runs before matching run_id
+    return {
+        "source": input_payload.source,
+        "run_date": input_payload.run_date,
+        "run_id": input_payload.run_id,
+    }
+
+
+def get_dataset_run_record_counts(
+    input_payload: "InputPayload", metadata_version: str | None = None
+) -> RunRecordCounts:
+    """Query TIMDEX dataset metadata for counts of records by action for a run.
+
+    All counts are returned from a single scan of the run's records. A metadata
+    version the caller already read is passed on to get_timdex_dataset.
     """
-    name_parts = file_name.split(".")[0].split("_")
-    load_type = name_parts[0].split("-")[-1]
-    sequence = name_parts[1] if len(name_parts) > 1 else None
-    return (load_type, sequence or None)
+    td = get_timdex_dataset(metadata_version)
+    index_count, delete_count, skip_count, error_count = td.metadata.conn.execute(
+        """
+        select
+            count(*) filter (where action = 'index'),
+            count(*) filter (where action = 'delete'),
+            count(*) filter (where action = 'skip'),
+            count(*) filter (where action = 'error')
+        from metadata.records
+        where source = $source
+        and run_date = $run_date
+        and run_id = $run_id
+        """,
+        _run_query_parameters(input_payload),
+    ).fetchone()
+    return RunRecordCounts(
+        index=index_count, delete=delete_count, skip=skip_count, error=error_count
+    )
 
 
-def list_s3_files_by_prefix(bucket: str, prefix: str) -> list[str]:
-    """List all filenames with the provided prefix in the provided bucket."""
-    s3_client = boto3.client("s3")
-    paginator = s3_client.get_paginator("list_objects_v2")
-    pages = paginator.paginate(Bucket=bucket, Prefix=prefix)
-    try:
-        s3_files = [s3_object["Key"] for page in pages for s3_object in page["Contents"]]
-    except KeyError as error:
-        # ruff: noqa: TRY400
-        logger.error(
-            "No files retrieved from bucket '%s' with prefix '%s'", bucket, prefix
-        )
-        raise errors.NoFilesError from error
-    return s3_files
+def get_timdex_dataset_metadata_version(location: str) -> str:
+    """Return a version identifier for the metadata of the TIMDEX dataset at location.
+
+    The identifier is a hash of the keys and ETags of every object under the dataset's
+    "metadata/" prefix, i.e. the static metadata database and any append deltas, so it
+    changes whenever metadata is written or merged. It costs a single S3 listing.
+    """
+    bucket, _, dataset_prefix = location.removeprefix("s3://").partition("/")
+    prefix = f"{dataset_prefix.strip('/')}/metadata/".lstrip("/")
+    paginator = clients.get_s3_client().get_paginator("list_objects_v2")
+    version = hashlib.sha256()
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for s3_object in page.get("Contents", []):
+            version.update(f"{s3_object['Key']}:{s3_object['ETag']}\n".encode())
+    return version.hexdigest()
+
 
+def get_timdex_dataset(metadata_version: str | None = None) -> "TIMDEXDataset":
+    """Return a TIMDEXDataset for the configured dataset location.
 
-def dataset_records_exist_for_run(run_id: str) -> bool:
-    """Query TIMDEX dataset metadata to confirm records to load and/or delete.
+    Loading a TIMDEXDataset reads its metadata from S3 and attaches it to a new DuckDB
+    connection, so the handle is cached at module scope and reused by later calls and
+    warm Lambda invocations until the dataset's metadata version changes.
 
-    A "run" is defined by a run-date + run-id, both provided as inputs to this lambda
-    invocation provided by the StepFunction.  We are interested only in records where
-    action is "index" or "delete".  If zero records exist, or have action "skip" or
-    "error", we do not need to perform any load commands.
+    Args:
+        metadata_version: The dataset's current metadata version, if the caller has
+            just read it, see get_timdex_dataset_metadata_version. Otherwise it is read
+            here, at the cost of a listing of the dataset's metadata.
     """
-    td = TIMDEXDataset(location=CONFIG.s3_timdex_dataset_location)
+    location = CONFIG.s3_timdex_dataset_location
+    version = metadata_version or get_timdex_dataset_metadata_version(location)
+    if (cached := _timdex_datasets.get(location)) and cached[0] == version:
+        logger.debug("Reusing TIMDEXDataset for '%s'", location)
+        return cached[1]
 
-    etl_run_count = td.metadata.conn.query(
-        f"""
-        select count(*)
-        from metadata.records
-        where run_id = '{run_id}'
-        and action in ('index','delete')
-        """
-    ).fetchone()[0]
-    return etl_run_count > 0
+    # TIMDEXDataset is imported here rather than at module level, as importing it also
+    # imports pyarrow and DuckDB, which would otherwise slow every cold start, including
+    # extract and transform steps that never query the dataset
+    from timdex_dataset_api.dataset import (  # type: ignore[import-untyped]  # noqa: PLC0415
+        TIMDEXDataset,
+    )
+
+    logger.debug(
+        "Loading TIMDEXDataset for '%s' at metadata version %s", location, version
+    )
+    td = TIMDEXDataset(location=location)
+    _timdex_datasets[location] = (version, td)
+    return td
+
+
+def clear_timdex_dataset_cache() -> None:
+    """Discard cached TIMDEXDataset handles."""
+    _timdex_datasets.clear()
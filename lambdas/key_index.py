@@ -0,0 +1,200 @@
+import logging
+import re
+import threading
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Self
+
+from lambdas import errors, helpers
+from lambdas.config import Config
+
+if TYPE_CHECKING:
+    from lambdas.format_input import InputPayload
+
+logger = logging.getLogger(__name__)
+
+CONFIG = Config()
+
+STEP_OUTPUT_STEPS = ("extract", "transform")
+
+# pipeline file keys, see StepOutputKey.encode
+STEP_OUTPUT_KEY = re.compile(
+    r"(?P<source>[^/]+)/(?P=source)-(?P<run_date>\d{4}-\d{2}-\d{2})-"
+    r"(?P<run_type>[a-z]+)-(?P<step>[a-z]+)ed-records-to-(?P<load_type>index|delete)"
+    r"(?:_(?P<sequence>[^.]+))?\.(?P<file_type>[a-z]+)"
+)
+
+# step output indexes by (bucket, source, run date), with the time each was built
+_indexes: dict[tuple[str, str, str], tuple[float, "StepOutputIndex"]] = {}
+_lock = threading.Lock()
+
+
+@dataclass(frozen=True, slots=True)
+class StepOutputKey:
+    """The parts of a TIMDEX pipeline file key, as encoded in its name."""
+
+    source: str
+    run_date: str
+    run_type: str
+    step: str
+    load_type: str
+    sequence: str | None
+    file_type: str
+
+    @classmethod
+    def for_run(
+        cls,
+        input_payload: "InputPayload",
+        step: str,
+        load_type: str,
+        sequence: str | None = None,
+    ) -> Self:
+        """Return the key parts of a pipeline file for the input payload's run.
+
+        Extract files are JSON Lines for geoharvester and browsertrix sources and XML
+        otherwise, transformed delete files are text and transformed index files JSON.
+        """
+        if step == "extract":
+            file_type = (
+                "jsonl"
+                if input_payload.source in CONFIG.GIS_SOURCES
+                or input_payload.source == "mitlibwebsite"
+                else "xml"
+            )
+        elif load_type == "delete":
+            file_type = "txt"
+        else:
+            file_type = "json"
+        return cls(
+            source=input_payload.source,
+            run_date=input_payload.run_date,
+            run_type=input_payload.run_type,
+            step=step,
+            load_type=load_type,
+            sequence=sequence,
+            file_type=file_type,
+        )
+
+    @classmethod
+    def decode(cls, key: str) -> Self | None:
+        """Return the parts of a pipeline file key, or None for any other key."""
+        if match := STEP_OUTPUT_KEY.fullmatch(key):
+            return cls(**match.groupdict())
+        return None
+
+    def encode(self) -> str:
+        """Return the pipeline file key with these parts."""
+        sequence_suffix = f"_{self.sequence}" if self.sequence else ""
+        return (
+            f"{self.source}/{self.source}-{self.run_date}-{self.run_type}-"
+            f"{self.step}ed-records-to-{self.load_type}{sequence_suffix}.{self.file_type}"
+        )
+
+
+class StepOutputIndex:
+    """In-memory index of the pipeline files for a source and run date.
+
+    Built from one listing of every step output file for the source and run date, so
+    the transform and load steps can look files up by run type, step and load type
+    without listing S3 or parsing file names again. The listing is split by run type,
+    step and file partition only past its first page, and keys that are not pipeline
+    files are skipped.
+    """
+
+    def __init__(self, s3_files: Iterable[helpers.S3File]):
+        self.files: dict[StepOutputKey, helpers.S3File] = {}
+        for s3_file in s3_files:
+            if step_output_key := StepOutputKey.decode(s3_file.key):
+                self.files[step_output_key] = s3_file
+
+    @classmethod
+    def build(cls, bucket: str, source: str, run_date: str) -> Self:
+        return cls(
+            helpers.list_s3_objects_by_prefix(
+                bucket,
+                f"{source}/{source}-{run_date}-",
+                partitions=[
+                    f"{run_type}-{step}ed-records{partition}"
+                    for run_type in CONFIG.VALID_RUN_TYPES
+                    for step in STEP_OUTPUT_STEPS
+                    for partition in helpers.STEP_OUTPUT_FILE_PARTITIONS
+                ],
+                allow_empty=True,
+            )
+        )
+
+    def find(
+        self, run_type: str, step: str, load_type: str | None = None
+    ) -> list[helpers.S3File]:
+        """Return the files for a run type, step and optional load type, by key."""
+        return sorted(
+            (
+                s3_file
+                for step_output_key, s3_file in self.files.items()
+                if step_output_key.run_type == run_type
+                and step_output_key.step == step
+                and load_type in (None, step_output_key.load_type)
+            ),
+            key=lambda s3_file: s3_file.key,
+        )
+
+
+def get_step_output_index(input_payload: "InputPayload") -> StepOutputIndex:
+    """Return the step output index for the input payload's source and run date.
+
+    Indexes are cached at module scope and reused by later calls and warm Lambda
+    invocations for up to Config.s3_key_index_ttl_seconds. Code that writes pipeline
+    files must call invalidate_step_output_index afterwards.
+    """
+    cache_key = (CONFIG.timdex_bucket, input_payload.source, input_payload.run_date)
+    with _lock:
+        cached = _indexes.get(cache_key)
+    if cached and time.monotonic() - cached[0] < CONFIG.s3_key_index_ttl_seconds:
+        logger.debug("Reusing step output index for %s", cache_key)
+        return cached[1]
+    built_at = time.monotonic()
+    index = StepOutputIndex.build(*cache_key)
+    logger.debug(
+        "Built step output index of %s files for %s", len(index.files), cache_key
+    )
+    with _lock:
+        _indexes[cache_key] = (built_at, index)
+    return index
+
+
+def list_step_output_files(
+    input_payload: "InputPayload", step: str, load_type: str | None = None
+) -> list[helpers.S3File]:
+    """Return the input payload's run files for a step, from the step output index.
+
+    Raises:
+        errors.NoFilesError: The index has no files for the run and step.
+    """
+    s3_files = get_step_output_index(input_payload).find(
+        input_payload.run_type, step, load_type
+    )
+    if not s3_files:
+        logger.error(
+            "No %sed files found in bucket '%s' for date '%s' and source '%s'",
+            step,
+            CONFIG.timdex_bucket,
+            input_payload.run_date,
+            input_payload.source,
+        )
+        raise errors.NoFilesError
+    return s3_files
+
+
+def invalidate_step_output_index(input_payload: "InputPayload") -> None:
+    """Discard the cached index for the input payload's source and run date."""
+    with _lock:
+        _indexes.pop(
+            (CONFIG.timdex_bucket, input_payload.source, input_payload.run_date), None
+        )
+
+
+def clear_step_output_index_cache() -> None:
+    """Discard all cached step output indexes."""
+    with _lock:
+        _indexes.clear()
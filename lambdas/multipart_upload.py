@@ -0,0 +1,192 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import TracebackType
+from typing import TYPE_CHECKING, Self
+
+from lambdas.buffers import BufferPool
+
+if TYPE_CHECKING:
+    from collections.abc import Buffer  # pragma: no cover
+
+    from mypy_boto3_s3.client import S3Client  # pragma: no cover
+    from mypy_boto3_s3.type_defs import CompletedPartTypeDef  # pragma: no cover
+
+logger = logging.getLogger(__name__)
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10_000
+
+
+class ParallelMultipartUpload:
+    """Write a stream of bytes to S3, uploading multipart parts concurrently.
+
+    Bytes written are copied into a part-sized buffer from a BufferPool; once a part is
+    full it is handed to a pool of upload threads. At most `max_in_flight` parts are
+    queued or uploading at any time; once that limit is reached, `write()` blocks until
+    a part completes and its buffer is recycled. Memory use is therefore fixed at
+    (max_in_flight + 1) * part_size, with no per-write allocations.
+
+    If any part fails, or the context manager exits with an exception, the multipart
+    upload is aborted so no orphaned parts are left behind. Objects smaller than a
+    single part are uploaded with one PutObject request instead.
+    """
+
+    def __init__(
+        self,
+        s3_client: "S3Client",
+        bucket: str,
+        key: str,
+        part_size: int = 8 * 1024 * 1024,
+        max_in_flight: int = 4,
+    ):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"Multipart part size must be at least {MIN_PART_SIZE}")
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.max_in_flight = max(max_in_flight, 1)
+        self.bytes_written = 0
+        self.upload_id: str | None = None
+        self._buffers = BufferPool(self.max_in_flight + 1, part_size)
+        self._part: bytearray | None = None
+        self._part_filled = 0
+        self._parts: list[Future[CompletedPartTypeDef]] = []
+        self._executor: ThreadPoolExecutor | None = None
+        self._error: BaseException | None = None
+        self._closed = False
+
+    def __enter__(self) -> Self:
+        """Return the upload for use as a writable context manager."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Complete the upload on success, otherwise abort it."""
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, data: "Buffer") -> int:
+        """Copy bytes into part buffers, uploading full parts as they fill.
+
+        The data is copied before returning, so callers may reuse their buffer.
+        """
+        with memoryview(data).cast("B") as view:
+            offset = 0
+            while offset < len(view):
+                if self._part is None:
+                    self._part = self._buffers.acquire()
+                    if self._error:
+                        raise self._error
+                size = min(self.part_size - self._part_filled, len(view) - offset)
+                self._part[self._part_filled : self._part_filled + size] = view[
+                    offset : offset + size
+                ]
+                self._part_filled += size
+                offset += size
+                if self._part_filled == self.part_size:
+                    self._submit_part(self._part, self._part_filled)
+                    self._part = None
+                    self._part_filled = 0
+            self.bytes_written += len(view)
+            return len(view)
+
+    def close(self) -> None:
+        """Upload any remaining bytes and complete the upload."""
+        if self._closed:
+            return
+        try:
+            if self.upload_id is None:
+                self.s3_client.put_object(
+                    Bucket=self.bucket, Key=self.key, Body=self._remaining_bytes()
+                )
+            else:
+                if self._part_filled:
+                    self._submit_part(self._part, self._part_filled)  # type: ignore[arg-type]
+                parts = [part.result() for part in self._parts]
+                self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    MultipartUpload={"Parts": parts},
+                )
+                logger.debug(
+                    "Completed multipart upload of '%s' in %s parts", self.key, len(parts)
+                )
+        except BaseException:
+            self.abort()
+            raise
+        self._shutdown()
+
+    def abort(self) -> None:
+        """Cancel queued parts and abort the multipart upload, if one was started."""
+        if self._closed:
+            return
+        for part in self._parts:
+            part.cancel()
+        self._shutdown()
+        if self.upload_id is not None:
+            logger.warning("Aborting multipart upload of '%s'", self.key)
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
+
+    def _remaining_bytes(self) -> bytes:
+        if self._part is None:
+            return b""
+        with memoryview(self._part) as view:
+            return bytes(view[: self._part_filled])
+
+    def _submit_part(self, buffer: bytearray, size: int) -> None:
+        if self.upload_id is None:
+            self.upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key
+            )["UploadId"]
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_in_flight, thread_name_prefix="multipart-upload"
+            )
+        if len(self._parts) >= MAX_PARTS:
+            raise ValueError(
+                f"Upload of '{self.key}' exceeds {MAX_PARTS} parts, increase part size"
+            )
+        part_number = len(self._parts) + 1
+        future = self._executor.submit(  # type: ignore[union-attr]
+            self._upload_part, part_number, buffer, size
+        )
+        future.add_done_callback(lambda part: self._part_done(part, buffer))
+        self._parts.append(future)
+
+    def _upload_part(
+        self, part_number: int, buffer: bytearray, size: int
+    ) -> "CompletedPartTypeDef":
+        # only the final, partially filled part is copied to trim it to size
+        if size < len(buffer):
+            with memoryview(buffer) as view:
+                body: bytes | bytearray = bytes(view[:size])
+        else:
+            body = buffer
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,  # type: ignore[arg-type]
+            PartNumber=part_number,
+            Body=body,
+        )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    def _part_done(self, part: "Future[CompletedPartTypeDef]", buffer: bytearray) -> None:
+        if not part.cancelled() and (error := part.exception()) and not self._error:
+            self._error = error
+        self._buffers.release(buffer)
+
+    def _shutdown(self) -> None:
+        self._closed = True
+        self._part = None
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
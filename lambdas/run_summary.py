@@ -0,0 +1,127 @@
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING
+
+from lambdas import clients, helpers, key_index
+from lambdas.config import Config
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.client import S3Client  # pragma: no cover
+
+    from lambdas.format_input import InputPayload
+
+logger = logging.getLogger(__name__)
+
+CONFIG = Config()
+
+
+@dataclass
+class RunSummary:
+    """Record counts and extract file totals for an ETL run.
+
+    The summary is computed from TIMDEX dataset metadata and a listing of the run's
+    extracted files, then saved as a small JSON object in the TIMDEX S3 bucket with the
+    dataset metadata version it was computed at. Later load checks for the run read it
+    directly instead of querying the dataset, until the metadata version changes.
+    """
+
+    source: str
+    run_id: str
+    run_date: str
+    run_type: str
+    record_counts: helpers.RunRecordCounts = field(
+        default_factory=helpers.RunRecordCounts
+    )
+    extract_file_count: int = 0
+    extract_bytes: int = 0
+    metadata_version: str | None = None
+
+    @classmethod
+    def from_dict(cls, summary: dict) -> "RunSummary":
+        return cls(
+            **{
+                **summary,
+                "record_counts": helpers.RunRecordCounts(**summary["record_counts"]),
+            }
+        )
+
+    def to_payload(self) -> dict:
+        """Return the summary for a step result payload."""
+        return {
+            "record-counts": asdict(self.record_counts),
+            "extract-file-count": self.extract_file_count,
+            "extract-bytes": self.extract_bytes,
+        }
+
+
+def generate_run_summary_key(input_payload: "InputPayload") -> str:
+    """Generate the TIMDEX S3 key of the run summary for a source and run id."""
+    return (
+        f"{input_payload.source}/run-summaries/{input_payload.source}-"
+        f"{input_payload.run_id}-run-summary.json"
+    )
+
+
+def load_run_summary(
+    s3_client: "S3Client", input_payload: "InputPayload"
+) -> RunSummary | None:
+    """Return the saved summary for a run, or None if none has been saved."""
+    if summary := helpers.read_json_object(
+        s3_client, CONFIG.timdex_bucket, generate_run_summary_key(input_payload)
+    ):
+        return RunSummary.from_dict(summary)
+    return None
+
+
+def create_run_summary(
+    input_payload: "InputPayload", metadata_version: str | None = None
+) -> RunSummary:
+    """Compute a run summary from TIMDEX dataset metadata and extracted files.
+
+    The summary records `metadata_version`, the dataset metadata version the caller
+    read before computing it, if given.
+    """
+    summary = RunSummary(
+        source=input_payload.source,
+        run_id=input_payload.run_id,
+        run_date=input_payload.run_date,
+        run_type=input_payload.run_type,
+        record_counts=helpers.get_dataset_run_record_counts(
+            input_payload, metadata_version
+        ),
+        metadata_version=metadata_version,
+    )
+    extract_files = key_index.get_step_output_index(input_payload).find(
+        input_payload.run_type, "extract"
+    )
+    summary.extract_file_count = len(extract_files)
+    summary.extract_bytes = sum(extract_file.size for extract_file in extract_files)
+    return summary
+
+
+def get_run_summary(input_payload: "InputPayload") -> RunSummary:
+    """Return the summary for a run, computing and saving it if not saved or stale.
+
+    A saved summary is stale once the TIMDEX dataset metadata has changed since it was
+    computed, e.g. when records written by the run's transform were not yet reflected,
+    or the transform was rerun with the same run id.
+    """
+    s3_client = clients.get_s3_client()
+    # the version is read before the counts, so a change made while they are counted
+    # leaves the saved summary stale rather than wrongly current
+    metadata_version = helpers.get_timdex_dataset_metadata_version(
+        CONFIG.s3_timdex_dataset_location
+    )
+    summary = load_run_summary(s3_client, input_payload)
+    if summary and summary.metadata_version == metadata_version:
+        logger.debug("Loaded run summary for run_id '%s'", input_payload.run_id)
+        return summary
+    summary = create_run_summary(input_payload, metadata_version)
+    helpers.write_json_object(
+        s3_client,
+        CONFIG.timdex_bucket,
+        generate_run_summary_key(input_payload),
+        asdict(summary),
+    )
+    logger.info("Saved run summary for run_id '%s'", input_payload.run_id)
+    return summary
@@ -0,0 +1,160 @@
+import logging
+import re
+from collections.abc import Callable
+from types import TracebackType
+from typing import TYPE_CHECKING, Self
+
+from lambdas.multipart_upload import ParallelMultipartUpload
+
+if TYPE_CHECKING:
+    from collections.abc import Buffer  # pragma: no cover
+
+logger = logging.getLogger(__name__)
+
+RECORD_START = re.compile(rb"<record[\s/>]")
+RECORD_END = re.compile(rb"</record\s*>")
+START_TAG = re.compile(rb"<([A-Za-z_][\w.:-]*)[^>]*>")
+MAX_RECORD_END_LENGTH = 16
+
+
+class RecordShardWriter:
+    """Split a streamed XML file of <record> elements into multiple shard files.
+
+    Bytes written are passed through to the current shard until it holds at least
+    `max_bytes` bytes or `max_records` records, checked at each </record> end tag. The
+    shard is then closed with the closing tag of the root element and a new shard is
+    opened with the same XML header (everything before the first <record>), so every
+    shard is a well-formed XML file. The final shard ends with the source's own footer.
+
+    Shards are opened by calling `open_shard` with the 1-based shard number, and are
+    written to as they stream, so the whole file is sharded in a single pass.
+    """
+
+    def __init__(
+        self,
+        open_shard: Callable[[int], ParallelMultipartUpload],
+        max_bytes: int | None = None,
+        max_records: int | None = None,
+    ):
+        self.open_shard = open_shard
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.shards: list[ParallelMultipartUpload] = []
+        self.shard_record_counts: list[int] = []
+        self._header: bytearray | None = bytearray()
+        self._shard_header = b""
+        self._footer = b""
+        self._pending: bytearray | None = None
+        self._tail = b""
+        self._closed = False
+
+    @property
+    def current_shard(self) -> ParallelMultipartUpload:
+        return self.shards[-1]
+
+    def __enter__(self) -> Self:
+        """Return the writer for use as a writable context manager."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Complete the final shard on success, otherwise abort it."""
+        if exc_type is None:
+            self.close()
+        elif self.shards and not self._closed:
+            self._closed = True
+            self.current_shard.abort()
+
+    def write(self, data: "Buffer") -> int:
+        """Write bytes to the current shard, starting new shards at record boundaries."""
+        with memoryview(data).cast("B") as view:
+            if self._header is not None:
+                return self._write_header(view)
+            # a record end tag may be split across the previous and current write
+            if self._tail:
+                window = self._tail + bytes(view[:MAX_RECORD_END_LENGTH])
+                if match := RECORD_END.search(window):
+                    start = match.end() - len(self._tail)
+                    self._write_shard(view[:start], records=1)
+                    return start + self._write_records(view[start:])
+            return self._write_records(view, self._tail)
+
+    def close(self) -> None:
+        """Close the final shard, opening it first if no records were written."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._header is not None:
+            self._open_next_shard(bytes(self._header))
+        elif self._pending is not None:
+            # only the source footer followed the last full shard's final record
+            self.current_shard.write(self._pending)
+        self._close_current_shard()
+
+    def _write_header(self, view: memoryview) -> int:
+        self._header += view  # type: ignore[operator]
+        if match := RECORD_START.search(self._header):  # type: ignore[arg-type]
+            records = bytes(self._header[match.start() :])
+            self._open_next_shard(bytes(self._header[: match.start()]))
+            self._header = None
+            root_tags = START_TAG.findall(self._shard_header)
+            self._footer = b"</" + root_tags[-1] + b">\n" if root_tags else b""
+            self._write_records(memoryview(records))
+        return len(view)
+
+    def _write_records(self, view: memoryview, tail: bytes = b"") -> int:
+        start = 0
+        for match in RECORD_END.finditer(view):  # type: ignore[call-overload]
+            self._write_shard(view[start : match.end()], records=1)
+            start = match.end()
+        self._write_shard(view[start:], records=0)
+        # keep the bytes since the last record end, for end tags split across writes
+        if start:
+            tail = b""
+        tail += bytes(view[max(start, len(view) - MAX_RECORD_END_LENGTH) :])
+        self._tail = tail[-MAX_RECORD_END_LENGTH:]
+        return len(view)
+
+    def _write_shard(self, view: memoryview, records: int) -> None:
+        # once a shard is full, hold bytes until another record confirms a new shard
+        # is needed, so a shard is never opened for the source footer alone
+        if self._pending is not None:
+            self._pending += view
+            if not records:
+                return
+            self.current_shard.write(self._footer)
+            self._close_current_shard()
+            pending, self._pending = self._pending, None
+            self._open_next_shard(self._shard_header)
+            self.current_shard.write(pending)
+        else:
+            self.current_shard.write(view)
+            if not records:
+                return
+        self.shard_record_counts[-1] += records
+        if (
+            self.max_bytes is not None
+            and self.current_shard.bytes_written >= self.max_bytes
+        ) or (
+            self.max_records is not None
+            and self.shard_record_counts[-1] >= self.max_records
+        ):
+            self._pending = bytearray()
+
+    def _open_next_shard(self, header: bytes) -> None:
+        self._shard_header = header
+        self.shards.append(self.open_shard(len(self.shards) + 1))
+        self.shard_record_counts.append(0)
+        self.current_shard.write(header)
+
+    def _close_current_shard(self) -> None:
+        self.current_shard.close()
+        logger.debug(
+            "Completed shard '%s' (%s records)",
+            self.current_shard.key,
+            self.shard_record_counts[-1],
+        )
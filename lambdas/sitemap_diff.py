@@ -0,0 +1,107 @@
+import logging
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING
+
+import smart_open  # type: ignore[import]
+
+from lambdas import clients, helpers
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.client import S3Client  # pragma: no cover
+
+    from lambdas.format_input import InputPayload
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SitemapDiff:
+    """Counts of the URLs added, changed, removed and unchanged in a run's sitemaps."""
+
+    added: int = 0
+    changed: int = 0
+    removed: int = 0
+    unchanged: int = 0
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+    def to_payload(self) -> dict:
+        """Return the diff for a step result payload."""
+        return asdict(self)
+
+
+def uses_sitemap_diff(input_payload: "InputPayload") -> bool:
+    """Return whether a mitlibwebsite run checks its sitemaps for changes before crawling.
+
+    Only daily runs given input field "btrix-current-sitemap-urls-file" are checked.
+    """
+    return (
+        input_payload.source == "mitlibwebsite"
+        and input_payload.run_type == "daily"
+        and "btrix-current-sitemap-urls-file" in input_payload.raw
+    )
+
+
+def read_sitemap_urls(s3_client: "S3Client", uri: str) -> Iterator[tuple[str, str]]:
+    """Stream the URL and last modified date of each line of a sitemap URLs file.
+
+    Lines hold a URL, optionally followed by whitespace and the sitemap <lastmod> of
+    the URL. Blank lines are skipped and a missing <lastmod> is returned as "".
+    """
+    with smart_open.open(uri, "r", transport_params={"client": s3_client}) as file:
+        for line in file:
+            if fields := line.split(maxsplit=1):
+                yield fields[0], fields[1].strip() if len(fields) > 1 else ""
+
+
+def diff_sitemap_urls(
+    s3_client: "S3Client", previous_uri: str, current_uri: str
+) -> SitemapDiff:
+    """Count the added, changed, removed and unchanged URLs between sitemap URLs files.
+
+    Only the previous file is held in memory, as a dict of URL to last modified date.
+    The current file is streamed once: each URL is popped from the dict, and counted as
+    changed if its last modified date differs or is unknown. URLs left in the dict were
+    removed.
+    """
+    previous_urls = dict(read_sitemap_urls(s3_client, previous_uri))
+    logger.debug("Read %s previous sitemap URLs", len(previous_urls))
+    sitemap_diff = SitemapDiff()
+    for url, lastmod in read_sitemap_urls(s3_client, current_uri):
+        previous_lastmod = previous_urls.pop(url, None)
+        if previous_lastmod is None:
+            sitemap_diff.added += 1
+        elif not lastmod or lastmod != previous_lastmod:
+            sitemap_diff.changed += 1
+        else:
+            sitemap_diff.unchanged += 1
+    sitemap_diff.removed = len(previous_urls)
+    return sitemap_diff
+
+
+def create_sitemap_diff(input_payload: "InputPayload") -> SitemapDiff | None:
+    """Diff a daily mitlibwebsite run's previous and current sitemap URLs files.
+
+    Returns None if either file does not exist, e.g. on the first run, when the run
+    cannot be checked for changes and is crawled as usual.
+    """
+    raw = input_payload.raw
+    previous_uri = raw["btrix-previous-sitemap-urls-file"]
+    current_uri = raw["btrix-current-sitemap-urls-file"]
+    for uri in (previous_uri, current_uri):
+        if not helpers.s3_object_exists(uri):
+            logger.warning("Sitemap URLs file '%s' not found, sitemaps not diffed", uri)
+            return None
+    sitemap_diff = diff_sitemap_urls(clients.get_s3_client(), previous_uri, current_uri)
+    logger.info(
+        "Sitemap URLs for run date '%s': %s added, %s changed, %s removed, %s unchanged",
+        input_payload.run_date,
+        sitemap_diff.added,
+        sitemap_diff.changed,
+        sitemap_diff.removed,
+        sitemap_diff.unchanged,
+    )
+    return sitemap_diff
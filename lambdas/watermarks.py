@@ -0,0 +1,102 @@
+import logging
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING
+
+from lambdas import clients, helpers
+from lambdas.config import Config
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.client import S3Client  # pragma: no cover
+
+    from lambdas.format_input import InputPayload
+
+logger = logging.getLogger(__name__)
+
+CONFIG = Config()
+
+
+@dataclass
+class HarvestWatermark:
+    """The most recent run date through which a source was successfully harvested.
+
+    Saved as a small JSON object in the TIMDEX S3 bucket by the finish step after a
+    successful load, or when a run has nothing to load, so daily harvests can start
+    from the last successful run instead of the previous day.
+    """
+
+    source: str
+    run_date: str
+    run_type: str
+    run_id: str
+
+
+def generate_harvest_watermark_key(source: str) -> str:
+    """Generate the TIMDEX S3 key of the harvest watermark for a source."""
+    return f"{source}/watermarks/{source}-harvest-watermark.json"
+
+
+def load_harvest_watermark(s3_client: "S3Client", source: str) -> HarvestWatermark | None:
+    """Return the saved harvest watermark for a source, or None if none has been saved."""
+    watermark = helpers.read_json_object(
+        s3_client, CONFIG.timdex_bucket, generate_harvest_watermark_key(source)
+    )
+    return HarvestWatermark(**watermark) if watermark else None
+
+
+def get_harvest_from_date(input_payload: "InputPayload") -> str:
+    """Return the from date of a daily harvest.
+
+    A run on a given date harvests from the previous day, see
+    helpers.generate_harvest_from_date, which is the date of the previous run when runs
+    are daily. If the source's last successful run is older, e.g. because a day was
+    missed, the harvest starts from that run's date instead so no dates are skipped.
+    Reruns of dates at or before the watermark use the previous day.
+
+    For a backfill (next step "backfill") the harvest starts from the day before input
+    field "backfill-start-date", covering every run date through the run date.
+    """
+    if input_payload.next_step == "backfill":
+        return helpers.generate_harvest_from_date(
+            helpers.format_run_date(input_payload.raw["backfill-start-date"])
+        )
+    from_date = helpers.generate_harvest_from_date(input_payload.run_date)
+    watermark = load_harvest_watermark(clients.get_s3_client(), input_payload.source)
+    if watermark and watermark.run_date < from_date:
+        logger.info(
+            "Harvesting source '%s' from last successful run date '%s'",
+            input_payload.source,
+            watermark.run_date,
+        )
+        return watermark.run_date
+    return from_date
+
+
+def update_harvest_watermark(input_payload: "InputPayload") -> None:
+    """Save the input payload's run as its source's watermark, if it is the latest."""
+    s3_client = clients.get_s3_client()
+    watermark = load_harvest_watermark(s3_client, input_payload.source)
+    if watermark and watermark.run_date > input_payload.run_date:
+        logger.debug(
+            "Harvest watermark for source '%s' is later than run date '%s', not updated",
+            input_payload.source,
+            input_payload.run_date,
+        )
+        return
+    helpers.write_json_object(
+        s3_client,
+        CONFIG.timdex_bucket,
+        generate_harvest_watermark_key(input_payload.source),
+        asdict(
+            HarvestWatermark(
+                source=input_payload.source,
+                run_date=input_payload.run_date,
+                run_type=input_payload.run_type,
+                run_id=input_payload.run_id,
+            )
+        ),
+    )
+    logger.info(
+        "Updated harvest watermark for source '%s' to run date '%s'",
+        input_payload.source,
+        input_payload.run_date,
+    )
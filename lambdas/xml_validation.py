@@ -0,0 +1,56 @@
+from typing import TYPE_CHECKING
+from xml.parsers import expat
+
+from lambdas import errors
+
+if TYPE_CHECKING:
+    from collections.abc import Buffer  # pragma: no cover
+
+    from lambdas.buffers import Writable
+
+
+class XMLRecordValidator:
+    """Check XML well-formedness and count <record> elements as bytes stream through.
+
+    Bytes written are fed to an incremental expat parser and then passed on to the
+    target unchanged. The parser keeps no document tree, only counters, so memory use
+    is constant regardless of file size. An errors.InvalidXMLError is raised as soon as
+    malformed XML is seen, or on close() if the document is truncated.
+    """
+
+    def __init__(
+        self,
+        target: "Writable",
+        name: str,
+    ):
+        self.target = target
+        self.name = name
+        self.record_count = 0
+        self.bytes_validated = 0
+        self._parser = expat.ParserCreate()
+        self._parser.EndElementHandler = self._end_element
+
+    def write(self, data: "Buffer") -> int:
+        """Validate bytes, then write them to the target."""
+        self._parse(data, is_final=False)
+        size = self.target.write(data)
+        self.bytes_validated += size
+        return size
+
+    def close(self) -> None:
+        """Confirm the document is complete. Does not close the target."""
+        self._parse(b"", is_final=True)
+
+    def _parse(self, data: "Buffer", *, is_final: bool) -> None:
+        try:
+            self._parser.Parse(data, is_final)  # type: ignore[arg-type]
+        except expat.ExpatError as error:
+            message = (
+                f"File '{self.name}' is not well-formed XML after {self.record_count} "
+                f"records: {error}"
+            )
+            raise errors.InvalidXMLError(message) from error
+
+    def _end_element(self, name: str) -> None:
+        if name.rpartition(":")[2] == "record":
+            self.record_count += 1
@@ -0,0 +1,117 @@
+"""Compare streaming and random-access tar extraction of a synthetic Alma export.
+
+Usage:
+    pipenv run python -m tests.benchmarks.benchmark_extract_tarfile [--size-mb 256]
+
+A synthetic gzipped tarball of Alma-like MARCXML is generated in a temporary directory,
+then extracted with both the forward-only streaming path used by
+`alma_prep.extract_tarfile` and the previous random-access path (`tar.getmembers()`
+followed by `tar.extractfile()`). Source bytes read, reads issued and wall time are
+reported for each.
+"""
+
+import argparse
+import io
+import tarfile
+import tempfile
+import time
+from collections.abc import Callable, Generator
+from typing import IO
+
+from lambdas import alma_prep
+
+RECORD = (
+    b"<record><leader>00000nam a2200000 a 4500</leader>"
+    b'<controlfield tag="001">%d</controlfield>'
+    b'<datafield tag="245" ind1="1" ind2="0"><subfield code="a">Title %d</subfield>'
+    b"</datafield></record>\n"
+)
+
+
+class CountingReader(io.RawIOBase):
+    """Wrap a file and count the bytes and reads requested from it, as for S3 GETs."""
+
+    def __init__(self, file: IO[bytes]):
+        self.file = file
+        self.bytes_read = 0
+        self.reads = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return self.file.seekable()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self.file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def readinto(self, buffer: bytearray) -> int:  # type: ignore[override]
+        size = self.file.readinto(buffer)  # type: ignore[attr-defined]
+        self.bytes_read += size
+        self.reads += 1
+        return size
+
+
+def random_access_extract_tarfile(
+    tar_file: IO[bytes],
+) -> Generator[IO[bytes], None, None]:
+    """Previous extraction path: build the member index, then seek back to extract."""
+    with tarfile.open(fileobj=tar_file) as tar:
+        for member in tar.getmembers():
+            contents = tar.extractfile(member)
+            if contents:
+                yield contents
+
+
+def build_synthetic_export(directory: str, size_mb: int) -> str:
+    xml_path = f"{directory}/export.xml"
+    with open(xml_path, "wb") as xml:
+        xml.write(b'<?xml version="1.0" encoding="UTF-8"?><collection>\n')
+        record_id = 0
+        while xml.tell() < size_mb * 1024 * 1024:
+            xml.write(RECORD % (record_id, record_id))
+            record_id += 1
+        xml.write(b"</collection>\n")
+    tar_path = f"{directory}/export.tar.gz"
+    with tarfile.open(tar_path, "w:gz") as tar:
+        tar.add(xml_path, arcname="export.xml")
+    return tar_path
+
+
+def run(
+    tar_path: str, extract: Callable[[IO[bytes]], Generator[IO[bytes], None, None]]
+) -> tuple[int, int, int, float]:
+    start = time.perf_counter()
+    with open(tar_path, "rb") as file:
+        reader = CountingReader(file)
+        members = extract(io.BufferedReader(reader))  # type: ignore[arg-type]
+        contents = next(members)
+        bytes_extracted = 0
+        while chunk := contents.read(8 * 1024 * 1024):
+            bytes_extracted += len(chunk)
+    return bytes_extracted, reader.bytes_read, reader.reads, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=256)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        tar_path = build_synthetic_export(directory, args.size_mb)
+        for name, extract in (
+            ("random-access", random_access_extract_tarfile),
+            ("streaming", alma_prep.extract_tarfile),
+        ):
+            extracted, downloaded, reads, elapsed = run(tar_path, extract)
+            print(  # noqa: T201
+                f"{name:>13}: extracted={extracted} downloaded={downloaded} "
+                f"reads={reads} seconds={elapsed:.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
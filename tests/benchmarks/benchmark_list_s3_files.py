@@ -0,0 +1,74 @@
+"""Compare single and partitioned listing of a large S3 step output prefix.
+
+Usage:
+    pipenv run python -m tests.benchmarks.benchmark_list_s3_files [--keys 10000]
+
+Creates `--keys` sequenced extract files under one prefix in a bucket mocked by moto,
+then times `helpers.list_s3_objects_by_prefix` listing them page by page, and listing
+them split at `helpers.STEP_OUTPUT_FILE_PARTITIONS`, concurrently once the first page
+comes back truncated. Both must return the same keys in the same order. Moto serves
+requests in-process with no network latency, so a simulated round trip of
+`--latency-ms` is added to each ListObjectsV2 request.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from moto import mock_aws
+
+from lambdas import clients, helpers
+
+BUCKET = "benchmark-bucket"
+PREFIX = "alma/alma-2022-09-12-full-extracted-records"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=10_000)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        clients.clear_client_cache()
+        s3_client = clients.get_s3_client()
+        s3_client.create_bucket(Bucket=BUCKET)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            executor.map(
+                lambda sequence: s3_client.put_object(
+                    Bucket=BUCKET,
+                    Key=f"{PREFIX}-to-index_{sequence + 1:02d}.xml",
+                    Body=b"",
+                ),
+                range(args.keys),
+            )
+
+        s3_client.meta.events.register(
+            "before-send.s3.ListObjectsV2",
+            lambda **_: time.sleep(args.latency_ms / 1000),
+        )
+        results = {}
+        for name, partitions in (
+            ("single", None),
+            ("partitioned", helpers.STEP_OUTPUT_FILE_PARTITIONS),
+        ):
+            start = time.perf_counter()
+            results[name] = [
+                s3_file.key
+                for s3_file in helpers.list_s3_objects_by_prefix(
+                    BUCKET, PREFIX, partitions
+                )
+            ]
+            seconds = time.perf_counter() - start
+            print(  # noqa: T201
+                f"{name:>11}: {len(results[name])} keys in {seconds:.2f}s"
+            )
+        assert results["single"] == results["partitioned"]
+
+
+if __name__ == "__main__":
+    main()
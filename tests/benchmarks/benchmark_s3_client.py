@@ -0,0 +1,50 @@
+"""Compare per-invocation S3 client overhead with and without the shared client cache.
+
+Usage:
+    pipenv run python -m tests.benchmarks.benchmark_s3_client [--invocations 200]
+
+Each simulated Lambda invocation gets an S3 client and lists a bucket mocked by moto,
+once by creating a new client with `boto3.client("s3")` as before, and once with the
+cached `clients.get_s3_client()`. Mean seconds per invocation are reported for each.
+"""
+
+import argparse
+import os
+import time
+from collections.abc import Callable
+
+import boto3
+from moto import mock_aws
+
+from lambdas import clients
+
+
+def run(get_client: Callable[[], object], invocations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(invocations):
+        client = get_client()
+        client.list_objects_v2(Bucket="benchmark-bucket")  # type: ignore[attr-defined]
+    return (time.perf_counter() - start) / invocations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invocations", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket="benchmark-bucket")
+        clients.clear_client_cache()
+        for name, get_client in (
+            ("new client", lambda: boto3.client("s3")),
+            ("cached client", clients.get_s3_client),
+        ):
+            seconds = run(get_client, args.invocations)
+            print(f"{name:>13}: {seconds * 1000:.2f} ms per invocation")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
 import boto3
+import duckdb
 import pytest
 from moto import mock_aws
 
+from lambdas import clients, helpers, key_index
+from lambdas.format_input import InputPayload
+
 
 @pytest.fixture(autouse=True)
 def _test_env(monkeypatch):
@@ -17,6 +24,9 @@ def _test_env(monkeypatch):
 
 @pytest.fixture(autouse=True)
 def mocked_s3():
+    clients.clear_client_cache()
+    helpers.clear_timdex_dataset_cache()
+    key_index.clear_step_output_index_cache()
     with mock_aws():
         client = boto3.client("s3", region_name="us-east-1")
         client.create_bucket(Bucket="test-timdex-bucket")
@@ -68,3 +78,58 @@ def run_id():
 @pytest.fixture
 def run_timestamp():
     return "2025-06-18T12:34:56.789000"
+
+
+@pytest.fixture
+def make_input_payload(run_id):
+    """Return a factory of "testsource" InputPayloads for run date 2022-01-02.
+
+    Event fields are passed as keyword arguments, with underscores for hyphens, and
+    override the defaults, e.g. make_input_payload(next_step="transform").
+    """
+
+    def _make_input_payload(**fields):
+        event = {
+            "next-step": "load",
+            "run-date": "2022-01-02",
+            "run-type": "daily",
+            "source": "testsource",
+            "run-id": run_id,
+        }
+        event.update({field.replace("_", "-"): value for field, value in fields.items()})
+        return InputPayload.from_event(event)
+
+    return _make_input_payload
+
+
+@pytest.fixture
+def timdex_dataset_metadata():
+    """Patch TIMDEXDataset loading with an in-memory DuckDB metadata.records table."""
+    conn = duckdb.connect()
+    conn.execute("create schema metadata")
+    conn.execute(
+        """
+        create table metadata.records (
+            timdex_record_id varchar,
+            source varchar,
+            run_date date,
+            run_id varchar,
+            action varchar
+        )
+        """
+    )
+    conn.executemany(
+        "insert into metadata.records values (?, ?, ?, ?, ?)",
+        [
+            ("testsource:1", "testsource", "2022-01-02", "run-abc-123", "index"),
+            ("testsource:2", "testsource", "2022-01-02", "run-abc-123", "index"),
+            ("testsource:3", "testsource", "2022-01-02", "run-abc-123", "delete"),
+            ("testsource:4", "testsource", "2022-01-02", "run-abc-123", "skip"),
+            ("testsource:5", "testsource", "2022-01-02", "run-def-456", "error"),
+            ("other:1", "othersource", "2022-01-02", "run-ghi-789", "index"),
+        ],
+    )
+    dataset = SimpleNamespace(metadata=SimpleNamespace(conn=conn))
+    with patch("lambdas.helpers.get_timdex_dataset", return_value=dataset):
+        yield conn
+    conn.close()
@@ -1,26 +1,70 @@
+import io
+import tarfile
+import time
+import tracemalloc
+from datetime import UTC, datetime
+from unittest.mock import MagicMock, patch
+
 import pytest
+from botocore.client import BaseClient
 from botocore.exceptions import ClientError
 
-from lambdas import alma_prep
+from lambdas import alma_prep, helpers
 from lambdas.format_input import InputPayload
+from lambdas.multipart_upload import MIN_PART_SIZE, ParallelMultipartUpload
 
 
 def test_extract_file_from_source_bucket_to_target_bucket(s3_client):
     with pytest.raises(ClientError):
         s3_client.head_object(Bucket="test-timdex-bucket", Key="extracted.xml")
 
-    alma_prep.extract_file_from_source_bucket_to_target_bucket(
+    extracted_files = alma_prep.extract_file_from_source_bucket_to_target_bucket(
         s3_client=s3_client,
         source_bucket="test-alma-bucket",
         source_file_key="exlibris/timdex/TIMDEX_ALMA_EXPORT_DAILY_20220912_210929[053]"
         "_delete.tar.gz",
         target_bucket="test-timdex-bucket",
-        target_file_key="extracted.xml",
+        target_file_keys=lambda _member, _shard: "extracted.xml",
     )
 
     response = s3_client.head_object(Bucket="test-timdex-bucket", Key="extracted.xml")
     # ruff: noqa: PLR2004
     assert response["ResponseMetadata"]["HTTPStatusCode"] == 200
+    assert extracted_files == [
+        alma_prep.ExtractedFile("extracted.xml", response["ContentLength"], 2)
+    ]
+
+
+def test_extract_file_from_source_bucket_to_target_bucket_multiple_members(s3_client):
+    tar_bytes = io.BytesIO()
+    with tarfile.open(fileobj=tar_bytes, mode="w:gz") as tar:
+        for number in range(1, 4):
+            xml = f"<collection>{number}</collection>".encode()
+            member = tarfile.TarInfo(f"export_{number}.xml")
+            member.size = len(xml)
+            tar.addfile(member, io.BytesIO(xml))
+    s3_client.put_object(
+        Bucket="test-alma-bucket", Key="multi.tar.gz", Body=tar_bytes.getvalue()
+    )
+
+    extracted_files = alma_prep.extract_file_from_source_bucket_to_target_bucket(
+        s3_client=s3_client,
+        source_bucket="test-alma-bucket",
+        source_file_key="multi.tar.gz",
+        target_bucket="test-timdex-bucket",
+        target_file_keys=lambda member, _shard: f"extracted_{member}.xml",
+    )
+
+    assert [extracted_file.key for extracted_file in extracted_files] == [
+        "extracted_1.xml",
+        "extracted_2.xml",
+        "extracted_3.xml",
+    ]
+    for number in range(1, 4):
+        response = s3_client.get_object(
+            Bucket="test-timdex-bucket", Key=f"extracted_{number}.xml"
+        )
+        assert response["Body"].read() == f"<collection>{number}</collection>".encode()
 
 
 def test_extract_tarfile():
@@ -33,6 +77,95 @@ def test_extract_tarfile():
         assert xml.startswith('<?xml version="1.0" encoding="UTF-8"?>')
 
 
+def test_extract_tarfile_reads_forward_only():
+    class ForwardOnlyReader(io.RawIOBase):
+        def __init__(self, data):
+            self.data = io.BytesIO(data)
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            return self.data.readinto(buffer)
+
+        def seek(self, *_args):
+            pytest.fail("seek not allowed")
+
+    with open(
+        "tests/fixtures/TIMDEX_ALMA_EXPORT_DAILY_20220912_210929[053]_delete.tar.gz",
+        "rb",
+    ) as tar:
+        data = tar.read()
+    extracted = alma_prep.extract_tarfile(ForwardOnlyReader(data))
+    xml = next(extracted).read().decode("utf-8")
+    assert xml.startswith('<?xml version="1.0" encoding="UTF-8"?>')
+
+
+def test_pipe_file_contents_copies_all_chunks_and_times_stages():
+    source = io.BytesIO(b"0123456789" * 100)
+    target = io.BytesIO()
+    timings = alma_prep.pipe_file_contents(source, target, chunk_size=7)
+    assert target.getvalue() == b"0123456789" * 100
+    assert timings.read_seconds > 0
+    assert timings.write_seconds > 0
+
+
+def test_pipe_file_contents_read_error_raised_in_caller():
+    source = MagicMock()
+    source.readinto.side_effect = OSError("corrupt gzip stream")
+    with pytest.raises(OSError, match="corrupt gzip stream"):
+        alma_prep.pipe_file_contents(source, io.BytesIO(), chunk_size=7)
+
+
+def test_pipe_file_contents_write_error_stops_producer():
+    source = io.BytesIO(b"x" * 1000)
+    target = MagicMock()
+    target.write.side_effect = RuntimeError("upload failed")
+    with pytest.raises(RuntimeError, match="upload failed"):
+        alma_prep.pipe_file_contents(source, target, chunk_size=1, buffers=1)
+    assert source.tell() < 1000
+
+
+def test_pipe_file_contents_to_multipart_upload_peak_memory_is_flat():
+    class SizedSource(io.RawIOBase):
+        def __init__(self, size):
+            self.remaining = size
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            size = min(len(buffer), self.remaining)
+            self.remaining -= size
+            return size
+
+    class NullS3Client:
+        def create_multipart_upload(self, **_kwargs):
+            return {"UploadId": "upload-id"}
+
+        def upload_part(self, **kwargs):
+            return {"ETag": str(kwargs["PartNumber"])}
+
+        def complete_multipart_upload(self, **_kwargs):
+            pass
+
+    def peak_memory(size):
+        tracemalloc.start()
+        with ParallelMultipartUpload(
+            NullS3Client(), "bucket", "key", part_size=MIN_PART_SIZE, max_in_flight=2
+        ) as upload:
+            alma_prep.pipe_file_contents(SizedSource(size), upload, 1024 * 1024)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak
+
+    small_peak = peak_memory(16 * 1024 * 1024)
+    large_peak = peak_memory(256 * 1024 * 1024)
+    buffer_memory = 3 * 1024 * 1024 + 3 * MIN_PART_SIZE
+    assert small_peak < buffer_memory * 1.1
+    assert large_peak < small_peak * 1.05
+
+
 def test_get_load_type_and_sequence_from_alma_export_filename_with_sequence():
     file_name = (
         "exlibris/timdex/TIMDEX_ALMA_EXPORT_DAILY_20220912_210929[053]_new_1.tar.gz"
@@ -57,6 +190,44 @@ def test_get_load_type_and_sequence_from_alma_export_filename_without_sequence()
     assert sequence is None
 
 
+def test_get_alma_export_member_sequence_first_member_keeps_file_sequence():
+    assert alma_prep.get_alma_export_member_sequence("01", 1) == "01"
+    assert alma_prep.get_alma_export_member_sequence(None, 1) is None
+
+
+def test_get_alma_export_member_sequence_later_members():
+    assert alma_prep.get_alma_export_member_sequence("01", 2) == "01-02"
+    assert alma_prep.get_alma_export_member_sequence(None, 3) == "03"
+
+
+def test_get_alma_export_member_sequence_shards():
+    assert alma_prep.get_alma_export_member_sequence("01", 1, 2) == "01-01-02"
+    assert alma_prep.get_alma_export_member_sequence(None, 1, 2) == "01-02"
+    assert alma_prep.get_alma_export_member_sequence(None, 2, 2) == "02-02"
+
+
+def test_prepare_alma_export_files_sharded(monkeypatch, s3_client, run_id, run_timestamp):
+    monkeypatch.setenv("ALMA_PREP_SHARD_MAX_RECORDS", "1")
+    event = {
+        "next-step": "transform",
+        "run-date": "2022-09-12T12:13:14Z",
+        "run-type": "daily",
+        "source": "alma",
+        "run-id": run_id,
+        "run-timestamp": run_timestamp,
+    }
+    input_payload = InputPayload.from_event(event)
+    alma_prep.prepare_alma_export_files(input_payload)
+    keys = [
+        s3_object["Key"]
+        for s3_object in s3_client.list_objects_v2(Bucket="test-timdex-bucket")[
+            "Contents"
+        ]
+    ]
+    assert len(keys) > 3
+    assert "alma/alma-2022-09-12-daily-extracted-records-to-index_01-01-02.xml" in keys
+
+
 def test_prepare_alma_export_files(s3_client, run_id, run_timestamp):
     starting_files_in_timdex_bucket = s3_client.list_objects_v2(
         Bucket="test-timdex-bucket"
@@ -73,7 +244,218 @@ def test_prepare_alma_export_files(s3_client, run_id, run_timestamp):
     input_payload = InputPayload.from_event(event)
     alma_prep.prepare_alma_export_files(input_payload)
     ending_files_in_timdex_bucket = s3_client.list_objects_v2(
-        Bucket="test-timdex-bucket"
+        Bucket="test-timdex-bucket", Prefix="alma/alma-"
     )["KeyCount"]
     # ruff: noqa: PLR2004
     assert ending_files_in_timdex_bucket == 3
+
+
+def test_prepare_alma_export_files_concurrently(
+    monkeypatch, s3_client, run_id, run_timestamp
+):
+    monkeypatch.setenv("ALMA_PREP_MAX_WORKERS", "3")
+    event = {
+        "next-step": "transform",
+        "run-date": "2022-09-12T12:13:14Z",
+        "run-type": "daily",
+        "source": "alma",
+        "run-id": run_id,
+        "run-timestamp": run_timestamp,
+    }
+    input_payload = InputPayload.from_event(event)
+    alma_prep.prepare_alma_export_files(input_payload)
+    ending_files_in_timdex_bucket = s3_client.list_objects_v2(
+        Bucket="test-timdex-bucket", Prefix="alma/alma-"
+    )["KeyCount"]
+    # ruff: noqa: PLR2004
+    assert ending_files_in_timdex_bucket == 3
+
+
+def test_prepare_alma_export_files_concurrently_raises_first_error(
+    monkeypatch, run_id, run_timestamp
+):
+    monkeypatch.setenv("ALMA_PREP_MAX_WORKERS", "3")
+    event = {
+        "next-step": "transform",
+        "run-date": "2022-09-12T12:13:14Z",
+        "run-type": "daily",
+        "source": "alma",
+        "run-id": run_id,
+        "run-timestamp": run_timestamp,
+    }
+    input_payload = InputPayload.from_event(event)
+    with (
+        patch(
+            "lambdas.alma_prep.extract_file_from_source_bucket_to_target_bucket",
+            side_effect=RuntimeError("extraction failed"),
+        ),
+        pytest.raises(RuntimeError, match="extraction failed"),
+    ):
+        alma_prep.prepare_alma_export_files(input_payload)
+
+
+def test_prepare_alma_export_files_writes_manifest(s3_client, run_id, run_timestamp):
+    event = {
+        "next-step": "transform",
+        "run-date": "2022-09-12T12:13:14Z",
+        "run-type": "daily",
+        "source": "alma",
+        "run-id": run_id,
+        "run-timestamp": run_timestamp,
+    }
+    input_payload = InputPayload.from_event(event)
+    alma_prep.prepare_alma_export_files(input_payload)
+    manifest = alma_prep.ExtractManifest.load(
+        s3_client,
+        "test-timdex-bucket",
+        "alma/manifests/alma-2022-09-12-daily-extract-manifest.json",
+    )
+    entry = manifest.entries[
+        "exlibris/timdex/TIMDEX_ALMA_EXPORT_DAILY_20220912_210929[053]_new_1.tar.gz"
+    ]
+    assert entry["files"][0]["key"] == (
+        "alma/alma-2022-09-12-daily-extracted-records-to-index_01.xml"
+    )
+    assert entry["size"] > 0
+
+
+def test_prepare_alma_export_files_rerun_skips_extracted_files(
+    s3_client, run_id, run_timestamp
+):
+    event = {
+        "next-step": "transform",
+        "run-date": "2022-09-12T12:13:14Z",
+        "run-type": "daily",
+        "source": "alma",
+        "run-id": run_id,
+        "run-timestamp": run_timestamp,
+    }
+    input_payload = InputPayload.from_event(event)
+    alma_prep.prepare_alma_export_files(input_payload)
+    s3_client.delete_object(
+        Bucket="test-timdex-bucket",
+        Key="alma/alma-2022-09-12-daily-extracted-records-to-index_02.xml",
+    )
+    with patch(
+        "lambdas.alma_prep.extract_file_from_source_bucket_to_target_bucket",
+        return_value=[],
+    ) as mocked_extract:
+        alma_prep.prepare_alma_export_files(input_payload)
+    mocked_extract.assert_called_once()
+    assert mocked_extract.call_args.args[2].endswith("_new_2.tar.gz")
+
+
+def test_prepare_alma_export_files_rerun_makes_no_head_requests(
+    s3_client, run_id, run_timestamp
+):
+    event = {
+        "next-step": "transform",
+        "run-date": "2022-09-12T12:13:14Z",
+        "run-type": "daily",
+        "source": "alma",
+        "run-id": run_id,
+        "run-timestamp": run_timestamp,
+    }
+    input_payload = InputPayload.from_event(event)
+    alma_prep.prepare_alma_export_files(input_payload)
+    make_api_call = BaseClient._make_api_call  # noqa: SLF001
+    with patch.object(
+        BaseClient, "_make_api_call", autospec=True, side_effect=make_api_call
+    ) as mocked_api_call:
+        prep_result = alma_prep.prepare_alma_export_files(input_payload)
+    operations = [call.args[1] for call in mocked_api_call.call_args_list]
+    assert "ListObjectsV2" in operations
+    assert "HeadObject" not in operations
+    assert "GetObject" in operations  # the extract manifest only
+    assert len(prep_result.extracted_files) == 3
+
+
+def test_prepare_alma_export_files_rerun_extracts_changed_source(
+    s3_client, run_id, run_timestamp
+):
+    event = {
+        "next-step": "transform",
+        "run-date": "2022-09-12T12:13:14Z",
+        "run-type": "daily",
+        "source": "alma",
+        "run-id": run_id,
+        "run-timestamp": run_timestamp,
+    }
+    input_payload = InputPayload.from_event(event)
+    alma_prep.prepare_alma_export_files(input_payload)
+    with open(
+        "tests/fixtures/TIMDEX_ALMA_EXPORT_DAILY_20220912_210929[053]_delete.tar.gz",
+        "rb",
+    ) as file:
+        s3_client.put_object(
+            Bucket="test-alma-bucket",
+            Key="exlibris/timdex/TIMDEX_ALMA_EXPORT_DAILY_20220912_210929[053]_new_1"
+            ".tar.gz",
+            Body=file,
+        )
+    with patch(
+        "lambdas.alma_prep.extract_file_from_source_bucket_to_target_bucket",
+        return_value=[],
+    ) as mocked_extract:
+        alma_prep.prepare_alma_export_files(input_payload)
+    mocked_extract.assert_called_once()
+    assert mocked_extract.call_args.args[2].endswith("_new_1.tar.gz")
+
+
+def test_time_budget_without_deadline_allows_next_file():
+    assert alma_prep.TimeBudget(None, 60).allows_next_file()
+
+
+def test_time_budget_reserves_longest_file_time():
+    time_budget = alma_prep.TimeBudget(time.monotonic() + 100, 60)
+    assert time_budget.allows_next_file()
+    time_budget.record_file(50)
+    assert not time_budget.allows_next_file()
+
+
+def test_continuation_token_round_trip():
+    export_files = [
+        helpers.S3File(
+            key=f"exlibris/timdex/a_new_{number}.tar.gz",
+            size=number * 100,
+            etag=f'"etag-{number}"',
+            last_modified=datetime(2022, 9, 12, 21, 9, 29, tzinfo=UTC),
+        )
+        for number in (1, 2)
+    ]
+    token = alma_prep.encode_continuation_token(export_files)
+    assert alma_prep.decode_continuation_token(token) == export_files
+
+
+def test_decode_continuation_token_invalid_raises_error():
+    with pytest.raises(ValueError, match="Invalid 'continuation-token'"):
+        alma_prep.decode_continuation_token("not-a-token")
+
+
+def test_prepare_alma_export_files_deadline_returns_remaining_files(
+    s3_client, run_id, run_timestamp
+):
+    event = {
+        "next-step": "transform",
+        "run-date": "2022-09-12T12:13:14Z",
+        "run-type": "daily",
+        "source": "alma",
+        "run-id": run_id,
+        "run-timestamp": run_timestamp,
+    }
+    input_payload = InputPayload.from_event(event)
+    with patch.object(
+        alma_prep.TimeBudget, "allows_next_file", side_effect=[True, False, False]
+    ):
+        prep_result = alma_prep.prepare_alma_export_files(
+            input_payload, deadline=time.monotonic()
+        )
+    assert len(prep_result.extracted_files) == 1
+    assert len(prep_result.remaining_export_files) == 2
+
+    input_payload.continuation_token = alma_prep.encode_continuation_token(
+        prep_result.remaining_export_files
+    )
+    prep_result = alma_prep.prepare_alma_export_files(input_payload)
+    assert len(prep_result.extracted_files) == 3
+    assert prep_result.remaining_export_files == []
@@ -0,0 +1,20 @@
+import queue
+
+import pytest
+
+from lambdas.buffers import BufferPool
+
+
+def test_buffer_pool_reuses_released_buffers():
+    pool = BufferPool(2, 16)
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+
+
+def test_buffer_pool_blocks_when_all_buffers_in_use():
+    pool = BufferPool(2, 16)
+    pool.acquire()
+    pool.acquire()
+    with pytest.raises(queue.Empty):
+        pool.acquire(timeout=0.01)
@@ -0,0 +1,29 @@
+from lambdas import clients
+
+
+def test_get_s3_client_reuses_cached_client():
+    assert clients.get_s3_client() is clients.get_s3_client()
+
+
+def test_get_s3_client_uses_configured_pool_size_as_minimum(monkeypatch):
+    configured_size, larger_size = 20, 40
+    monkeypatch.setenv("S3_MAX_POOL_CONNECTIONS", str(configured_size))
+    assert clients.get_s3_client(5).meta.config.max_pool_connections == configured_size
+    assert clients.get_s3_client(larger_size).meta.config.max_pool_connections == (
+        larger_size
+    )
+
+
+def test_get_s3_client_configured_from_env(monkeypatch):
+    monkeypatch.setenv("AWS_RETRY_MODE", "standard")
+    monkeypatch.setenv("AWS_MAX_ATTEMPTS", "3")
+    monkeypatch.setenv("S3_TCP_KEEPALIVE", "false")
+    config = clients.get_s3_client().meta.config
+    assert config.retries == {"mode": "standard", "total_max_attempts": 3}
+    assert config.tcp_keepalive is False
+
+
+def test_clear_client_cache_creates_new_client():
+    client = clients.get_s3_client()
+    clients.clear_client_cache()
+    assert clients.get_s3_client() is not client
@@ -1,9 +1,25 @@
+from datetime import UTC, datetime
+
 import pytest
 from freezegun import freeze_time
 
-from lambdas import commands
+from lambdas import commands, helpers
 from lambdas.format_input import InputPayload
 
+EXTRACT_PREFIX = "testsource/testsource-2022-01-02-full-extracted-records"
+
+
+def _s3_files(*keys, sizes=None):
+    return [
+        helpers.S3File(
+            key=key,
+            size=sizes[number] if sizes else 0,
+            etag='"etag"',
+            last_modified=datetime(2022, 1, 2, tzinfo=UTC),
+        )
+        for number, key in enumerate(keys)
+    ]
+
 
 def test_generate_extract_command_required_input_fields():
     event = {
@@ -27,6 +43,30 @@ def test_generate_extract_command_required_input_fields():
     }
 
 
+def test_generate_extract_command_daily_uses_harvest_watermark(s3_client):
+    s3_client.put_object(
+        Bucket="test-timdex-bucket",
+        Key="testsource/watermarks/testsource-harvest-watermark.json",
+        Body=(
+            '{"source": "testsource", "run_date": "2021-12-30", "run_type": "daily", '
+            '"run_id": "run-previous"}'
+        ),
+    )
+    event = {
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "daily",
+        "next-step": "extract",
+        "source": "testsource",
+        "oai-pmh-host": "https://example.com/oai",
+        "oai-metadata-format": "oai_dc",
+    }
+    input_payload = InputPayload.from_event(event)
+    assert (
+        "--from-date=2021-12-30"
+        in commands.generate_extract_command(input_payload)["extract-command"]
+    )
+
+
 def test_generate_extract_command_all_input_fields():
     event = {
         "run-date": "2022-01-02T12:13:14Z",
@@ -127,6 +167,219 @@ def test_generate_extract_command_mitlibwebsite_daily():
     }
 
 
+def test_generate_extract_command_mitlibwebsite_daily_sitemap_diff_crawls_sitemaps():
+    event = {
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "daily",
+        "next-step": "extract",
+        "source": "mitlibwebsite",
+        "btrix-config-yaml-file": "s3://bucket/config.yaml",
+        "btrix-sitemaps": ["https://libraries.mit.edu/sitemap.xml"],
+        "btrix-sitemap-urls-output-file": "s3://bucket/output.txt",
+        "btrix-previous-sitemap-urls-file": "s3://bucket/previous.txt",
+        "btrix-current-sitemap-urls-file": "s3://bucket/current.txt",
+    }
+    input_payload = InputPayload.from_event(event)
+    assert commands.generate_extract_command(input_payload) == {
+        "extract-command": [
+            "harvest",
+            "--config-yaml-file=s3://bucket/config.yaml",
+            "--records-output-file=s3://test-timdex-bucket/mitlibwebsite/"
+            "mitlibwebsite-2022-01-02-daily-extracted-records-to-index.jsonl",
+            "--sitemap=https://libraries.mit.edu/sitemap.xml",
+            "--sitemap-from-date=2022-01-01",
+            "--sitemap-urls-output-file=s3://bucket/output.txt",
+            "--previous-sitemap-urls-file=s3://bucket/previous.txt",
+        ]
+    }
+
+
+def test_generate_partitioned_extract_commands_mitlibwebsite(s3_client):
+    event = {
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "daily",
+        "next-step": "extract",
+        "source": "mitlibwebsite",
+        "btrix-config-yaml-file": "s3://bucket/config.yaml",
+        "btrix-sitemaps": ["s3://bucket/c.xml", "s3://bucket/b.xml", "s3://bucket/a.xml"],
+        "btrix-sitemap-urls-output-file": "s3://bucket/output.txt",
+        "btrix-previous-sitemap-urls-file": "s3://test-timdex-bucket/previous.txt",
+        "btrix-crawl-partitions": 2,
+    }
+    input_payload = InputPayload.from_event(event)
+    a_c = commands.generate_sitemap_set_id(["s3://bucket/a.xml", "s3://bucket/c.xml"])
+    b = commands.generate_sitemap_set_id(["s3://bucket/b.xml"])
+    for key in (f"previous_{a_c}.txt", f"previous_{b}.txt"):
+        s3_client.put_object(Bucket="test-timdex-bucket", Key=key, Body=b"")
+    records_output_file = (
+        "--records-output-file=s3://test-timdex-bucket/mitlibwebsite/"
+        "mitlibwebsite-2022-01-02-daily-extracted-records-to-index"
+    )
+    assert commands.generate_partitioned_extract_commands(input_payload) == {
+        "partitions-to-extract": [
+            {
+                "extract-command": [
+                    "harvest",
+                    "--config-yaml-file=s3://bucket/config.yaml",
+                    f"{records_output_file}_01.jsonl",
+                    "--sitemap=s3://bucket/a.xml",
+                    "--sitemap=s3://bucket/c.xml",
+                    "--sitemap-from-date=2022-01-01",
+                    f"--sitemap-urls-output-file=s3://bucket/output_{a_c}.txt",
+                    "--previous-sitemap-urls-file="
+                    f"s3://test-timdex-bucket/previous_{a_c}.txt",
+                ]
+            },
+            {
+                "extract-command": [
+                    "harvest",
+                    "--config-yaml-file=s3://bucket/config.yaml",
+                    f"{records_output_file}_02.jsonl",
+                    "--sitemap=s3://bucket/b.xml",
+                    "--sitemap-from-date=2022-01-01",
+                    f"--sitemap-urls-output-file=s3://bucket/output_{b}.txt",
+                    f"--previous-sitemap-urls-file=s3://test-timdex-bucket/previous_{b}.txt",
+                ]
+            },
+        ]
+    }
+
+
+def test_generate_browsertrix_partitions_capped_at_sitemap_count():
+    event = {
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "full",
+        "next-step": "extract",
+        "source": "mitlibwebsite",
+        "btrix-config-yaml-file": "s3://bucket/config.yaml",
+        "btrix-sitemaps": ["s3://bucket/a.xml", "s3://bucket/b.xml"],
+        "btrix-sitemap-urls-output-file": "s3://bucket/output.txt",
+        "btrix-crawl-partitions": 5,
+    }
+    input_payload = InputPayload.from_event(event)
+    a = commands.generate_sitemap_set_id(["s3://bucket/a.xml"])
+    b = commands.generate_sitemap_set_id(["s3://bucket/b.xml"])
+    assert commands.generate_browsertrix_partitions(input_payload) == [
+        {
+            "sitemaps": ["s3://bucket/a.xml"],
+            "sitemap_urls_output_file": f"s3://bucket/output_{a}.txt",
+        },
+        {
+            "sitemaps": ["s3://bucket/b.xml"],
+            "sitemap_urls_output_file": f"s3://bucket/output_{b}.txt",
+        },
+    ]
+
+
+def test_generate_browsertrix_partitions_missing_previous_file_omitted(s3_client):
+    event = {
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "daily",
+        "next-step": "extract",
+        "source": "mitlibwebsite",
+        "btrix-config-yaml-file": "s3://bucket/config.yaml",
+        "btrix-sitemaps": ["s3://bucket/a.xml", "s3://bucket/b.xml"],
+        "btrix-sitemap-urls-output-file": "s3://bucket/output.txt",
+        "btrix-previous-sitemap-urls-file": "s3://test-timdex-bucket/previous.txt",
+        "btrix-crawl-partitions": 2,
+    }
+    a = commands.generate_sitemap_set_id(["s3://bucket/a.xml"])
+    for key in ("previous.txt", f"previous_{a}.txt"):
+        s3_client.put_object(Bucket="test-timdex-bucket", Key=key, Body=b"")
+    input_payload = InputPayload.from_event(event)
+    assert [
+        partition.get("previous_sitemap_urls_file")
+        for partition in commands.generate_browsertrix_partitions(input_payload)
+    ] == [f"s3://test-timdex-bucket/previous_{a}.txt", None]
+
+
+def test_generate_sitemap_set_id_ignores_order():
+    a, b = "s3://bucket/a.xml", "s3://bucket/b.xml"
+    a_b = commands.generate_sitemap_set_id([a, b])
+    assert commands.generate_sitemap_set_id([b, a]) == a_b
+    assert commands.generate_sitemap_set_id([a]) != a_b
+
+
+def test_generate_partitioned_extract_commands_by_set_spec():
+    event = {
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "full",
+        "next-step": "extract",
+        "source": "dspace",
+        "oai-pmh-host": "https://example.com/oai",
+        "oai-metadata-format": "oai_dc",
+        "oai-full-harvest-set-specs": ["com_1", "com_2"],
+    }
+    input_payload = InputPayload.from_event(event)
+    assert commands.generate_partitioned_extract_commands(input_payload) == {
+        "partitions-to-extract": [
+            {
+                "extract-command": [
+                    "--host=https://example.com/oai",
+                    "--output-file=s3://test-timdex-bucket/dspace/"
+                    f"dspace-2022-01-02-full-extracted-records-to-index_0{number}.xml",
+                    "harvest",
+                    "--method=get",
+                    "--metadata-format=oai_dc",
+                    "--exclude-deleted",
+                    f"--set-spec=com_{number}",
+                ]
+            }
+            for number in (1, 2)
+        ]
+    }
+
+
+def test_generate_partitioned_extract_commands_by_date_window():
+    event = {
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "full",
+        "next-step": "extract",
+        "source": "testsource",
+        "verbose": "true",
+        "oai-pmh-host": "https://example.com/oai",
+        "oai-metadata-format": "oai_dc",
+        "oai-set-spec": "testset",
+        "oai-full-harvest-date-windows": [
+            {"until-date": "2019-12-31"},
+            {"from-date": "2020-01-01"},
+        ],
+    }
+    input_payload = InputPayload.from_event(event)
+    output_file = (
+        "--output-file=s3://test-timdex-bucket/testsource/"
+        "testsource-2022-01-02-full-extracted-records-to-index"
+    )
+    assert commands.generate_partitioned_extract_commands(input_payload) == {
+        "partitions-to-extract": [
+            {
+                "extract-command": [
+                    "--verbose",
+                    "--host=https://example.com/oai",
+                    f"{output_file}_01.xml",
+                    "harvest",
+                    "--metadata-format=oai_dc",
+                    "--until-date=2019-12-31",
+                    "--exclude-deleted",
+                    "--set-spec=testset",
+                ]
+            },
+            {
+                "extract-command": [
+                    "--verbose",
+                    "--host=https://example.com/oai",
+                    f"{output_file}_02.xml",
+                    "harvest",
+                    "--metadata-format=oai_dc",
+                    "--from-date=2020-01-01",
+                    "--exclude-deleted",
+                    "--set-spec=testset",
+                ]
+            },
+        ]
+    }
+
+
 def test_generate_transform_commands_required_input_fields(run_id, run_timestamp):
     event = {
         "next-step": "transform",
@@ -137,9 +390,9 @@ def test_generate_transform_commands_required_input_fields(run_id, run_timestamp
         "run-timestamp": run_timestamp,
     }
     input_payload = InputPayload.from_event(event)
-    extract_output_files = [
-        "testsource/testsource-2022-01-02-full-extracted-records-to-index.xml"
-    ]
+    extract_output_files = _s3_files(
+        "testsource/testsource-2022-01-02-full-extracted-records-to-index.xml",
+    )
     assert commands.generate_transform_commands(
         input_payload,
         extract_output_files,
@@ -169,11 +422,11 @@ def test_generate_transform_commands_all_input_fields(run_id, run_timestamp):
         "run-timestamp": run_timestamp,
     }
     input_payload = InputPayload.from_event(event)
-    extract_output_files = [
+    extract_output_files = _s3_files(
         "testsource/testsource-2022-01-02-daily-extracted-records-to-index_01.xml",
         "testsource/testsource-2022-01-02-daily-extracted-records-to-index_02.xml",
         "testsource/testsource-2022-01-02-daily-extracted-records-to-delete.xml",
-    ]
+    )
     assert commands.generate_transform_commands(
         input_payload,
         extract_output_files,
@@ -223,9 +476,9 @@ def test_transform_commands_source_with_exclusion_list(run_id, run_timestamp):
         "run-timestamp": run_timestamp,
     }
     input_payload = InputPayload.from_event(event)
-    extract_output_files = [
-        "libguides/libguides-2022-01-02-full-extracted-records-to-index.jsonl"
-    ]
+    extract_output_files = _s3_files(
+        "libguides/libguides-2022-01-02-full-extracted-records-to-index.jsonl",
+    )
     assert commands.generate_transform_commands(
         input_payload,
         extract_output_files,
@@ -246,6 +499,83 @@ def test_transform_commands_source_with_exclusion_list(run_id, run_timestamp):
     }
 
 
+def test_plan_transform_tasks_without_target_size_one_task_per_file():
+    extract_output_files = _s3_files(
+        f"{EXTRACT_PREFIX}-to-index_01.xml", f"{EXTRACT_PREFIX}-to-index_02.xml"
+    )
+    assert commands.plan_transform_tasks(extract_output_files, None) == [
+        [extract_output_files[0]],
+        [extract_output_files[1]],
+    ]
+
+
+def test_plan_transform_tasks_packs_small_files_and_isolates_large_ones():
+    extract_output_files = _s3_files(
+        f"{EXTRACT_PREFIX}-to-delete.xml",
+        f"{EXTRACT_PREFIX}-to-index_01.xml",
+        f"{EXTRACT_PREFIX}-to-index_02.xml",
+        f"{EXTRACT_PREFIX}-to-index_03.xml",
+        f"{EXTRACT_PREFIX}-to-index_04.xml",
+        f"{EXTRACT_PREFIX}-to-index_05.xml",
+        sizes=[1, 60, 150, 30, 40, 10],
+    )
+    tasks = commands.plan_transform_tasks(extract_output_files, 100)
+    assert [
+        [file.key.removeprefix(EXTRACT_PREFIX) for file in task] for task in tasks
+    ] == [
+        ["-to-delete.xml"],
+        ["-to-index_01.xml", "-to-index_04.xml"],
+        ["-to-index_02.xml"],
+        ["-to-index_03.xml", "-to-index_05.xml"],
+    ]
+
+
+def test_generate_transform_commands_with_target_size(monkeypatch, run_id, run_timestamp):
+    monkeypatch.setenv("TRANSFORM_TASK_TARGET_SIZE_MB", "1")
+    event = {
+        "next-step": "transform",
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "daily",
+        "source": "testsource",
+        "run-id": run_id,
+        "run-timestamp": run_timestamp,
+    }
+    input_payload = InputPayload.from_event(event)
+    prefix = "testsource/testsource-2022-01-02-daily-extracted-records-to-"
+    extract_output_files = _s3_files(
+        f"{prefix}index_01.xml",
+        f"{prefix}index_02.xml",
+        f"{prefix}index_03.xml",
+        sizes=[1000, 2 * 1024 * 1024, 2000],
+    )
+    assert commands.generate_transform_commands(input_payload, extract_output_files) == {
+        "files-to-transform": [
+            {
+                "transform-command": [
+                    f"--input-file=s3://test-timdex-bucket/{prefix}index_01.xml",
+                    f"--input-file=s3://test-timdex-bucket/{prefix}index_03.xml",
+                    "--output-location=s3://test-timdex-bucket/dataset",
+                    "--source=testsource",
+                    f"--run-id={run_id}",
+                    f"--run-timestamp={run_timestamp}",
+                ],
+                "input-bytes": 3000,
+            },
+            {
+                "transform-command": [
+                    f"--input-file=s3://test-timdex-bucket/{prefix}index_02.xml",
+                    "--output-location=s3://test-timdex-bucket/dataset",
+                    "--source=testsource",
+                    f"--run-id={run_id}",
+                    f"--run-timestamp={run_timestamp}",
+                ],
+                "input-bytes": 2 * 1024 * 1024,
+                "oversized": True,
+            },
+        ]
+    }
+
+
 def test_generate_load_commands_daily(run_id):
     event = {
         "next-step": "load",
@@ -1,4 +1,4 @@
-# ruff: noqa: FBT003
+# ruff: noqa: FBT003, PLR2004
 
 import pytest
 
@@ -30,3 +30,49 @@ def test_verify_env_missing_env_raises_error(monkeypatch):
 
 def test_verify_env_all_present_returns_none():
     assert CONFIG.check_required_env_vars() is None
+
+
+def test_alma_prep_max_workers_defaults_to_one(monkeypatch):
+    monkeypatch.delenv("ALMA_PREP_MAX_WORKERS", raising=False)
+    assert CONFIG.alma_prep_max_workers == 1
+
+
+def test_alma_prep_max_workers_less_than_one_raises_error(monkeypatch):
+    monkeypatch.setenv("ALMA_PREP_MAX_WORKERS", "0")
+    with pytest.raises(OSError, match="must be a positive integer"):
+        _ = CONFIG.alma_prep_max_workers
+
+
+def test_alma_prep_upload_part_size_below_s3_minimum_raises_error(monkeypatch):
+    monkeypatch.setenv("ALMA_PREP_UPLOAD_PART_SIZE_MB", "4")
+    with pytest.raises(OSError, match="must be at least 5"):
+        _ = CONFIG.alma_prep_upload_part_size
+
+
+def test_alma_prep_upload_max_in_flight_capped_by_lambda_memory(monkeypatch):
+    monkeypatch.setenv("ALMA_PREP_MAX_WORKERS", "2")
+    monkeypatch.setenv("ALMA_PREP_UPLOAD_MAX_IN_FLIGHT", "16")
+    monkeypatch.setenv("ALMA_PREP_UPLOAD_PART_SIZE_MB", "8")
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "256")
+    # 8 buffers per file: 1 filling, 3 for reads, leaving 4 in flight
+    assert CONFIG.alma_prep_upload_max_in_flight == 4
+
+
+def test_alma_prep_upload_max_in_flight_over_lambda_memory_raises_error(monkeypatch):
+    monkeypatch.setenv("ALMA_PREP_MAX_WORKERS", "2")
+    monkeypatch.setenv("ALMA_PREP_UPLOAD_PART_SIZE_MB", "8")
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "128")
+    with pytest.raises(OSError, match="exceed half of the Lambda memory size"):
+        _ = CONFIG.alma_prep_upload_max_in_flight
+
+
+def test_s3_list_max_workers_less_than_one_raises_error(monkeypatch):
+    monkeypatch.setenv("S3_LIST_MAX_WORKERS", "0")
+    with pytest.raises(OSError, match="must be a positive integer"):
+        _ = CONFIG.s3_list_max_workers
+
+
+def test_aws_retry_mode_invalid_raises_error(monkeypatch):
+    monkeypatch.setenv("AWS_RETRY_MODE", "fast")
+    with pytest.raises(OSError, match="must be one of: legacy, standard, adaptive"):
+        _ = CONFIG.aws_retry_mode
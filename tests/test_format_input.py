@@ -1,6 +1,14 @@
+# ruff: noqa: PLR2004
+
+import io
+import subprocess
+import sys
+import tarfile
 from unittest.mock import patch
 
-from lambdas import format_input
+from botocore.client import BaseClient
+
+from lambdas import format_input, helpers, watermarks
 
 
 def test_lambda_handler_with_next_step_extract():
@@ -105,6 +113,162 @@ def test_lambda_handler_with_next_step_extract_mitlibwebsite_daily():
     }
 
 
+def test_lambda_handler_with_next_step_extract_full_partitioned():
+    event = {
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "full",
+        "next-step": "extract",
+        "source": "testsource",
+        "oai-pmh-host": "https://example.com/oai",
+        "oai-metadata-format": "oai_dc",
+        "oai-full-harvest-set-specs": ["a", "b", "c"],
+    }
+    result = format_input.lambda_handler(event, {})
+    assert result["next-step"] == "transform"
+    assert result["harvester-type"] == "oai"
+    assert len(result["extract"]["partitions-to-extract"]) == 3
+
+
+def test_lambda_handler_with_next_step_extract_daily_ignores_partitions():
+    event = {
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "daily",
+        "next-step": "extract",
+        "source": "testsource",
+        "oai-pmh-host": "https://example.com/oai",
+        "oai-metadata-format": "oai_dc",
+        "oai-full-harvest-set-specs": ["a", "b", "c"],
+    }
+    result = format_input.lambda_handler(event, {})
+    assert "extract-command" in result["extract"]
+
+
+def test_lambda_handler_with_next_step_extract_mitlibwebsite_partitioned():
+    event = {
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "full",
+        "next-step": "extract",
+        "source": "mitlibwebsite",
+        "btrix-config-yaml-file": "s3://bucket/config.yaml",
+        "btrix-sitemaps": ["s3://bucket/a.xml", "s3://bucket/b.xml"],
+        "btrix-sitemap-urls-output-file": "s3://bucket/output.txt",
+        "btrix-crawl-partitions": 2,
+    }
+    result = format_input.lambda_handler(event, {})
+    assert result["harvester-type"] == "browsertrix"
+    assert len(result["extract"]["partitions-to-extract"]) == 2
+
+
+def test_lambda_handler_with_next_step_extract_mitlibwebsite_sitemap_diff(s3_client):
+    event = {
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "daily",
+        "next-step": "extract",
+        "source": "mitlibwebsite",
+        "btrix-config-yaml-file": "s3://bucket/config.yaml",
+        "btrix-sitemaps": ["https://libraries.mit.edu/sitemap.xml"],
+        "btrix-sitemap-urls-output-file": "s3://test-timdex-bucket/output.txt",
+        "btrix-previous-sitemap-urls-file": "s3://test-timdex-bucket/previous.txt",
+        "btrix-current-sitemap-urls-file": "s3://test-timdex-bucket/current.txt",
+    }
+    s3_client.put_object(
+        Bucket="test-timdex-bucket", Key="previous.txt", Body="https://a\n"
+    )
+    s3_client.put_object(
+        Bucket="test-timdex-bucket", Key="current.txt", Body="https://a\nhttps://b\n"
+    )
+    result = format_input.lambda_handler(event, {})
+    assert result["next-step"] == "transform"
+    extract_command = result["extract"]["extract-command"]
+    assert "--sitemap=https://libraries.mit.edu/sitemap.xml" in extract_command
+    assert result["extract"]["sitemap-diff"] == {
+        "added": 1,
+        "changed": 1,
+        "removed": 0,
+        "unchanged": 0,
+    }
+
+
+def test_lambda_handler_with_next_step_extract_mitlibwebsite_first_sitemap_diff(
+    s3_client,
+):
+    event = {
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "daily",
+        "next-step": "extract",
+        "source": "mitlibwebsite",
+        "btrix-config-yaml-file": "s3://bucket/config.yaml",
+        "btrix-sitemaps": ["https://libraries.mit.edu/sitemap.xml"],
+        "btrix-sitemap-urls-output-file": "s3://test-timdex-bucket/output.txt",
+        "btrix-previous-sitemap-urls-file": "s3://test-timdex-bucket/previous.txt",
+        "btrix-current-sitemap-urls-file": "s3://test-timdex-bucket/current.txt",
+    }
+    s3_client.put_object(
+        Bucket="test-timdex-bucket", Key="current.txt", Body="https://a\n"
+    )
+    result = format_input.lambda_handler(event, {})
+    assert result["next-step"] == "transform"
+    assert "sitemap-diff" not in result["extract"]
+
+
+def test_lambda_handler_with_next_step_extract_mitlibwebsite_no_sitemap_changes(
+    s3_client,
+):
+    event = {
+        "run-date": "2022-01-02T12:13:14Z",
+        "run-type": "daily",
+        "next-step": "extract",
+        "source": "mitlibwebsite",
+        "btrix-config-yaml-file": "s3://bucket/config.yaml",
+        "btrix-sitemaps": ["https://libraries.mit.edu/sitemap.xml"],
+        "btrix-sitemap-urls-output-file": "s3://test-timdex-bucket/output.txt",
+        "btrix-previous-sitemap-urls-file": "s3://test-timdex-bucket/previous.txt",
+        "btrix-current-sitemap-urls-file": "s3://test-timdex-bucket/current.txt",
+    }
+    for key in ("previous.txt", "current.txt"):
+        s3_client.put_object(
+            Bucket="test-timdex-bucket", Key=key, Body="https://a\t2022-01-01\n"
+        )
+    result = format_input.lambda_handler(event, {})
+    assert result["next-step"] == "exit-ok"
+    assert "extract" not in result
+
+
+def test_lambda_handler_with_next_step_backfill():
+    event = {
+        "run-date": "2022-01-05T12:13:14Z",
+        "run-type": "daily",
+        "next-step": "backfill",
+        "source": "testsource",
+        "backfill-start-date": "2022-01-02",
+        "oai-pmh-host": "https://example.com/oai",
+        "oai-metadata-format": "oai_dc",
+    }
+    assert format_input.lambda_handler(event, {}) == {
+        "next-step": "transform",
+        "run-date": "2022-01-05",
+        "run-type": "daily",
+        "source": "testsource",
+        "verbose": False,
+        "harvester-type": "oai",
+        "extract": {
+            "extract-command": [
+                "--host=https://example.com/oai",
+                "--output-file=s3://test-timdex-bucket/testsource/"
+                "testsource-2022-01-05-daily-extracted-records-to-index.xml",
+                "harvest",
+                "--metadata-format=oai_dc",
+                "--from-date=2022-01-01",
+            ]
+        },
+        "backfill": {
+            "start-date": "2022-01-02",
+            "end-date": "2022-01-05",
+            "run-dates": 4,
+        },
+    }
+
+
 def test_lambda_handler_with_next_step_transform_files_present(s3_client, run_timestamp):
     s3_client.put_object(
         Bucket="test-timdex-bucket",
@@ -191,11 +355,38 @@ def test_lambda_handler_with_next_step_transform_alma_files_present(run_timestam
                         f"--run-timestamp={run_timestamp}",
                     ]
                 },
-            ]
+            ],
+            "extract-summary": {
+                "file-count": 3,
+                "record-count": 250,
+                "bytes": 3074630,
+            },
         },
     }
 
 
+def test_lambda_handler_transform_alma_does_not_list_timdex_bucket(run_timestamp):
+    event = {
+        "run-date": "2022-09-12",
+        "run-type": "daily",
+        "next-step": "transform",
+        "source": "alma",
+        "run-id": "run-abc-123",
+        "run-timestamp": run_timestamp,
+    }
+    make_api_call = BaseClient._make_api_call  # noqa: SLF001
+    with patch.object(
+        BaseClient, "_make_api_call", autospec=True, side_effect=make_api_call
+    ) as mocked_api_call:
+        result = format_input.lambda_handler(event, {})
+    assert len(result["transform"]["files-to-transform"]) == 3
+    assert [
+        call.args[2]["Bucket"]
+        for call in mocked_api_call.call_args_list
+        if call.args[1] == "ListObjectsV2"
+    ] == ["test-alma-bucket"]
+
+
 def test_lambda_handler_with_next_step_transform_auto_generated_timestamp(s3_client):
     s3_client.put_object(
         Bucket="test-timdex-bucket",
@@ -311,13 +502,13 @@ def test_lambda_handler_with_next_step_load_files_present(s3_client):
     }
 
     with patch(
-        "lambdas.helpers.dataset_records_exist_for_run",
-        return_value=True,
+        "lambdas.helpers.get_dataset_run_record_counts",
+        return_value=helpers.RunRecordCounts(index=5, delete=2),
     ) as _mocked_record_count:
         response = format_input.lambda_handler(event, {})
 
     assert response == {
-        "next-step": "end",
+        "next-step": "finish",
         "run-date": "2022-01-02",
         "run-type": "daily",
         "source": "testsource",
@@ -332,7 +523,12 @@ def test_lambda_handler_with_next_step_load_files_present(s3_client):
                 "--source",
                 "testsource",
                 "s3://test-timdex-bucket/dataset",
-            ]
+            ],
+            "run-summary": {
+                "record-counts": {"index": 5, "delete": 2, "skip": 0, "error": 0},
+                "extract-file-count": 0,
+                "extract-bytes": 0,
+            },
         },
     }
 
@@ -347,8 +543,8 @@ def test_lambda_handler_with_next_step_load_no_files_present():
     }
 
     with patch(
-        "lambdas.helpers.dataset_records_exist_for_run",
-        return_value=False,
+        "lambdas.helpers.get_dataset_run_record_counts",
+        return_value=helpers.RunRecordCounts(),
     ) as _mocked_record_count:
         response = format_input.lambda_handler(event, {})
 
@@ -364,3 +560,119 @@ def test_lambda_handler_with_next_step_load_no_files_present():
             "were found for run_id 'run-abc-123'."
         ),
     }
+
+
+def test_lambda_handler_with_next_step_load_does_not_update_harvest_watermark(
+    s3_client,
+):
+    event = {
+        "run-date": "2022-01-02",
+        "run-type": "daily",
+        "next-step": "load",
+        "source": "testsource",
+        "run-id": "run-abc-123",
+    }
+    with patch(
+        "lambdas.helpers.get_dataset_run_record_counts",
+        return_value=helpers.RunRecordCounts(index=1),
+    ):
+        format_input.lambda_handler(event, {})
+    assert watermarks.load_harvest_watermark(s3_client, "testsource") is None
+
+
+def test_lambda_handler_with_next_step_finish_updates_harvest_watermark(s3_client):
+    event = {
+        "run-date": "2022-01-02",
+        "run-type": "daily",
+        "next-step": "finish",
+        "source": "testsource",
+        "run-id": "run-abc-123",
+    }
+    assert format_input.lambda_handler(event, {}) == {
+        "next-step": "end",
+        "run-date": "2022-01-02",
+        "run-type": "daily",
+        "source": "testsource",
+        "verbose": False,
+    }
+    watermark = watermarks.load_harvest_watermark(s3_client, "testsource")
+    assert watermark.run_date == "2022-01-02"
+    assert watermark.run_id == "run-abc-123"
+
+
+def test_lambda_handler_transform_alma_out_of_time_returns_continuation(run_timestamp):
+    class AlmostTimedOutContext:
+        def get_remaining_time_in_millis(self):
+            return 1000
+
+    event = {
+        "run-date": "2022-09-12",
+        "run-type": "daily",
+        "next-step": "transform",
+        "source": "alma",
+        "run-id": "run-abc-123",
+        "run-timestamp": run_timestamp,
+    }
+    result = format_input.lambda_handler(event, AlmostTimedOutContext())
+    assert result["next-step"] == "transform"
+    assert "transform" not in result
+
+    event["continuation-token"] = result["continuation-token"]
+    result = format_input.lambda_handler(event, {})
+    assert result["next-step"] == "load"
+    assert "continuation-token" not in result
+    assert len(result["transform"]["files-to-transform"]) == 3
+
+
+def test_lambda_handler_transform_alma_invalid_xml_exits_with_error(
+    s3_client, run_timestamp
+):
+    tar_bytes = io.BytesIO()
+    with tarfile.open(fileobj=tar_bytes, mode="w:gz") as tar:
+        xml = b"<collection><record><leader>truncated"
+        member = tarfile.TarInfo("export.xml")
+        member.size = len(xml)
+        tar.addfile(member, io.BytesIO(xml))
+    s3_client.put_object(
+        Bucket="test-alma-bucket",
+        Key="exlibris/timdex/TIMDEX_ALMA_EXPORT_DAILY_20220913_210929[053]_new.tar.gz",
+        Body=tar_bytes.getvalue(),
+    )
+    event = {
+        "run-date": "2022-09-13",
+        "run-type": "daily",
+        "next-step": "transform",
+        "source": "alma",
+        "run-id": "run-abc-123",
+        "run-timestamp": run_timestamp,
+    }
+    result = format_input.lambda_handler(event, {})
+    assert result["next-step"] == "exit-error"
+    assert "is not well-formed XML" in result["message"]
+    assert "Contents" not in s3_client.list_objects_v2(
+        Bucket="test-timdex-bucket", Prefix="alma/alma-"
+    )
+
+
+# generous budget for cold importing the lambda handler module, in microseconds; with
+# TIMDEXDataset (and so pyarrow and DuckDB) imported eagerly this is several times over
+FORMAT_INPUT_IMPORT_TIME_BUDGET_US = 1_500_000
+LAZY_IMPORTS = ("timdex_dataset_api", "duckdb", "pyarrow")
+
+
+def test_format_input_import_time_within_budget_and_defers_dataset_imports():
+    # fixed argv built from sys.executable, no untrusted input
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", "import lambdas.format_input"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    # lines are "import time: <self us> | <cumulative us> | <indented module name>"
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            _, cumulative, module = line.split("|")
+            import_times[module.strip()] = int(cumulative)
+    assert import_times["lambdas.format_input"] < FORMAT_INPUT_IMPORT_TIME_BUDGET_US
+    assert not [module for module in import_times if module.startswith(LAZY_IMPORTS)]
@@ -1,6 +1,9 @@
-# ruff: noqa: PT011
+# ruff: noqa: PLR2004, PT011
+
+from unittest.mock import patch
 
 import pytest
+from botocore.client import BaseClient
 from freezegun import freeze_time
 
 from lambdas import errors, helpers
@@ -91,6 +94,121 @@ def test_validate_input_with_all_required_harvest_fields_returns_none():
     assert InputPayload.validate_input(event) is None
 
 
+@pytest.mark.parametrize(
+    ("fields", "error"),
+    [
+        ({"run-type": "full"}, "must be 'daily' when 'next-step=backfill'"),
+        ({"source": "alma"}, "not supported for source 'alma'"),
+        ({"backfill-start-date": None}, "'backfill-start-date' required"),
+        ({"backfill-start-date": "01/01/2022"}, "'backfill-start-date' value must be"),
+        ({"backfill-start-date": "2022-01-03"}, "must not be after 'run-date'"),
+    ],
+)
+def test_validate_input_backfill_raises_error(fields, error):
+    event = {
+        "next-step": "backfill",
+        "run-date": "2022-01-02",
+        "run-type": "daily",
+        "source": "testsource",
+        "backfill-start-date": "2021-12-30",
+        "oai-pmh-host": "https://example.com/oai",
+        "oai-metadata-format": "oai_dc",
+        **fields,
+    }
+    if fields.get("backfill-start-date", "") is None:
+        del event["backfill-start-date"]
+    with pytest.raises(ValueError, match=error):
+        InputPayload.validate_input(event)
+
+
+def test_validate_input_backfill_missing_harvest_fields_raises_error():
+    event = {
+        "next-step": "backfill",
+        "run-date": "2022-01-02",
+        "run-type": "daily",
+        "source": "testsource",
+        "backfill-start-date": "2021-12-30",
+    }
+    with pytest.raises(ValueError, match="required harvest fields"):
+        InputPayload.validate_input(event)
+
+
+def test_validate_input_with_both_harvest_partition_fields_raises_error():
+    event = {
+        "next-step": "extract",
+        "run-date": "2022-01-02",
+        "run-type": "full",
+        "source": "testsource",
+        "oai-pmh-host": "https://example.com/oai",
+        "oai-metadata-format": "oai_dc",
+        "oai-full-harvest-set-specs": ["a"],
+        "oai-full-harvest-date-windows": [{"until-date": "2020-01-01"}],
+    }
+    with pytest.raises(ValueError, match="only one of the harvest partition fields"):
+        InputPayload.validate_input(event)
+
+
+def test_validate_input_with_empty_harvest_partitions_raises_error():
+    event = {
+        "next-step": "extract",
+        "run-date": "2022-01-02",
+        "run-type": "full",
+        "source": "testsource",
+        "oai-pmh-host": "https://example.com/oai",
+        "oai-metadata-format": "oai_dc",
+        "oai-full-harvest-set-specs": [],
+    }
+    with pytest.raises(ValueError, match="must be a non-empty list"):
+        InputPayload.validate_input(event)
+
+
+def test_validate_input_with_invalid_harvest_date_window_raises_error():
+    event = {
+        "next-step": "extract",
+        "run-date": "2022-01-02",
+        "run-type": "full",
+        "source": "testsource",
+        "oai-pmh-host": "https://example.com/oai",
+        "oai-metadata-format": "oai_dc",
+        "oai-full-harvest-date-windows": [{"from": "2020-01-01"}],
+    }
+    with pytest.raises(ValueError, match="optional 'from-date' and 'until-date'"):
+        InputPayload.validate_input(event)
+
+
+@pytest.mark.parametrize("partitions", [0, "2", None])
+def test_validate_input_mitlibwebsite_invalid_crawl_partitions_raises_error(partitions):
+    event = {
+        "next-step": "extract",
+        "run-date": "2022-01-02",
+        "run-type": "full",
+        "source": "mitlibwebsite",
+        "btrix-config-yaml-file": "s3://bucket/config.yaml",
+        "btrix-sitemaps": ["https://example.com/sitemap.xml"],
+        "btrix-sitemap-urls-output-file": "s3://bucket/output.txt",
+        "btrix-crawl-partitions": partitions,
+    }
+    with pytest.raises(ValueError, match="'btrix-crawl-partitions' must be a positive"):
+        InputPayload.validate_input(event)
+
+
+def test_validate_input_mitlibwebsite_sitemap_diff_with_partitions_raises_error():
+    event = {
+        "next-step": "extract",
+        "run-date": "2022-01-02",
+        "run-type": "daily",
+        "source": "mitlibwebsite",
+        "btrix-config-yaml-file": "s3://bucket/config.yaml",
+        "btrix-sitemaps": ["https://example.com/sitemap.xml"],
+        "btrix-sitemap-urls-output-file": "s3://bucket/output.txt",
+        "btrix-previous-sitemap-urls-file": "s3://bucket/previous.txt",
+        "btrix-current-sitemap-urls-file": "s3://bucket/current.txt",
+        "btrix-crawl-partitions": 2,
+    }
+    with pytest.raises(ValueError, match="cannot be used with"):
+        InputPayload.validate_input(event)
+
+
 def test_validate_input_mitlibwebsite_missing_harvest_fields_raises_error():
     event = {
         "next-step": "extract",
@@ -175,84 +293,209 @@ def test_generate_index_name():
     assert helpers.generate_index_name("testsource") == "testsource-2022-01-02t12-13-14"
 
 
-def test_generate_step_output_filename_geoharvester_file_type():
-    assert (
-        helpers.generate_step_output_filename("gismit", "index", "prefix", "extract")
-        == "prefix-to-index.jsonl"
+def test_list_s3_objects_by_prefix(s3_client):
+    s3_client.put_object(Bucket="test-timdex-bucket", Key="prefix-b", Body="bb")
+    s3_client.put_object(Bucket="test-timdex-bucket", Key="prefix-a", Body="a")
+    s3_client.put_object(Bucket="test-timdex-bucket", Key="other-prefix-c", Body="c")
+    s3_files = helpers.list_s3_objects_by_prefix("test-timdex-bucket", "prefix-")
+    assert [s3_file.key for s3_file in s3_files] == ["prefix-a", "prefix-b"]
+    assert [s3_file.size for s3_file in s3_files] == [1, 2]
+    head = s3_client.head_object(Bucket="test-timdex-bucket", Key="prefix-a")
+    assert s3_files[0].etag == head["ETag"]
+    assert s3_files[0].last_modified == head["LastModified"]
+    assert not hasattr(s3_files[0], "__dict__")
+
+
+def _list_objects_calls(bucket, prefix, partitions):
+    make_api_call = BaseClient._make_api_call  # noqa: SLF001
+    with patch.object(
+        BaseClient, "_make_api_call", autospec=True, side_effect=make_api_call
+    ) as mocked_call:
+        s3_files = helpers.list_s3_objects_by_prefix(bucket, prefix, partitions)
+    calls = [
+        call for call in mocked_call.call_args_list if call.args[1] == "ListObjectsV2"
+    ]
+    return [s3_file.key for s3_file in s3_files], len(calls)
+
+
+def test_list_s3_objects_by_prefix_with_partitions_single_page_lists_once(s3_client):
+    prefix = "testsource/testsource-2022-01-02-full-extracted-records"
+    for key in (f"{prefix}-to-index_01.xml", f"{prefix}-to-delete.xml"):
+        s3_client.put_object(Bucket="test-timdex-bucket", Key=key, Body="")
+    keys, list_calls = _list_objects_calls(
+        "test-timdex-bucket", prefix, helpers.STEP_OUTPUT_FILE_PARTITIONS
     )
-    assert (
-        helpers.generate_step_output_filename("gisogm", "index", "prefix", "extract")
-        == "prefix-to-index.jsonl"
+    assert keys == [f"{prefix}-to-delete.xml", f"{prefix}-to-index_01.xml"]
+    assert list_calls == 1
+
+
+def test_list_s3_objects_by_prefix_with_partitions_matches_single_listing(
+    monkeypatch, s3_client
+):
+    monkeypatch.setattr(helpers, "S3_LIST_PAGE_SIZE", 3)
+    prefix = "testsource/testsource-2022-01-02-full-extracted-records"
+    keys = [f"{prefix}-to-index_{sequence:02d}.xml" for sequence in range(1, 25)] + [
+        f"{prefix}-to-delete.xml",
+        f"{prefix}-to-index.xml",
+        f"{prefix}-unexpected.xml",
+    ]
+    for key in reversed(keys):
+        s3_client.put_object(Bucket="test-timdex-bucket", Key=key, Body="")
+    s3_client.put_object(
+        Bucket="test-timdex-bucket", Key="testsource/other-file.xml", Body=""
     )
+    partitioned, list_calls = _list_objects_calls(
+        "test-timdex-bucket", prefix, helpers.STEP_OUTPUT_FILE_PARTITIONS
+    )
+    assert partitioned == sorted(keys)
+    assert list_calls > 1
+    assert [
+        s3_file.key
+        for s3_file in helpers.list_s3_objects_by_prefix("test-timdex-bucket", prefix)
+    ] == partitioned
+
+
+def test_list_s3_objects_by_prefix_with_partitions_lists_keys_outside_partitions(
+    monkeypatch, s3_client
+):
+    monkeypatch.setattr(helpers, "S3_LIST_PAGE_SIZE", 1)
+    expected_keys = [
+        "prefix-0",
+        "prefix-a1",
+        "prefix-a2",
+        "prefix-ab1",
+        "prefix-b1",
+        "prefix-c1",
+        "prefix-d1",
+    ]
+    for key in expected_keys:
+        s3_client.put_object(Bucket="test-timdex-bucket", Key=key, Body="")
+    keys, _ = _list_objects_calls("test-timdex-bucket", "prefix-", ["c", "a", "ab", "a"])
+    assert keys == expected_keys
+
+
+def test_list_s3_objects_by_prefix_with_partitions_no_files_raises_error():
+    with pytest.raises(errors.NoFilesError):
+        helpers.list_s3_objects_by_prefix(
+            "test-timdex-bucket", "the/right-prefix", partitions=["a", "b"]
+        )
+
+
+def test_list_s3_objects_by_prefix_no_files_raises_error():
+    with pytest.raises(errors.NoFilesError):
+        helpers.list_s3_objects_by_prefix("test-timdex-bucket", "the/right-prefix")
 
 
-def test_generate_step_output_filename_with_sequence():
+def test_list_s3_objects_by_prefix_no_files_allow_empty():
     assert (
-        helpers.generate_step_output_filename(
-            "source", "index", "prefix", "extract", "01"
+        helpers.list_s3_objects_by_prefix(
+            "test-timdex-bucket", "the/right-prefix", allow_empty=True
         )
-        == "prefix-to-index_01.xml"
+        == []
     )
 
 
-def test_generate_step_output_filename_without_sequence():
-    assert (
-        helpers.generate_step_output_filename("source", "delete", "prefix", "transform")
-        == "prefix-to-delete.txt"
+def test_get_dataset_run_record_counts(make_input_payload, timdex_dataset_metadata):
+    assert helpers.get_dataset_run_record_counts(
+        make_input_payload()
+    ) == helpers.RunRecordCounts(index=2, delete=1, skip=1)
+
+
+def test_get_dataset_run_record_counts_no_records(
+    make_input_payload, timdex_dataset_metadata
+):
+    counts = helpers.get_dataset_run_record_counts(
+        make_input_payload(run_id="run-def-456")
     )
+    assert counts == helpers.RunRecordCounts(error=1)
+    assert counts.to_load == 0
 
 
-def test_generate_step_output_prefix(run_id, run_timestamp):
-    event = {
-        "next-step": "transform",
-        "run-date": "2022-01-02T12:13:14Z",
-        "run-type": "full",
-        "source": "testsource",
-        "run-id": run_id,
-        "run-timestamp": run_timestamp,
-    }
-    input_payload = InputPayload.from_event(event)
-    assert (
-        helpers.generate_step_output_prefix(input_payload, "extract")
-        == "testsource/testsource-2022-01-02-full-extracted-records"
+def test_get_dataset_run_record_counts_filters_by_source(
+    make_input_payload, timdex_dataset_metadata
+):
+    counts = helpers.get_dataset_run_record_counts(
+        make_input_payload(run_id="run-ghi-789")
     )
+    assert counts == helpers.RunRecordCounts()
 
 
-def test_get_load_type_and_sequence_from_timdex_filename_with_sequence():
-    assert helpers.get_load_type_and_sequence_from_timdex_filename(
-        "testsource/testsource-2022-01-02-full-extracted-records-to-index_05.xml"
-    ) == ("index", "05")
+def test_get_dataset_run_record_counts_binds_parameters(
+    make_input_payload, timdex_dataset_metadata
+):
+    counts = helpers.get_dataset_run_record_counts(
+        make_input_payload(run_id="run-abc-123' or '1'='1")
+    )
+    assert counts == helpers.RunRecordCounts()
 
 
-def test_get_load_type_and_sequence_from_timdex_filename_without_sequence():
-    assert helpers.get_load_type_and_sequence_from_timdex_filename(
-        "testsource/testsource-2022-01-02-full-transformed-records-to-delete.json"
-    ) == ("delete", None)
+def test_get_timdex_dataset_metadata_version_changes_with_metadata(s3_client):
+    location = "s3://test-timdex-bucket/dataset"
+    s3_client.put_object(
+        Bucket="test-timdex-bucket", Key="dataset/metadata/metadata.duckdb", Body=b"v1"
+    )
+    version = helpers.get_timdex_dataset_metadata_version(location)
+    assert helpers.get_timdex_dataset_metadata_version(location) == version
 
+    s3_client.put_object(
+        Bucket="test-timdex-bucket", Key="dataset/data/records/records.parquet", Body=b""
+    )
+    assert helpers.get_timdex_dataset_metadata_version(location) == version
 
-def test_list_s3_files_by_prefix(s3_client):
     s3_client.put_object(
         Bucket="test-timdex-bucket",
-        Key="the/right-prefix-for-a-file.txt",
-        Body="I am a file",
+        Key="dataset/metadata/append_deltas/delta.parquet",
+        Body=b"delta",
     )
+    assert helpers.get_timdex_dataset_metadata_version(location) != version
+
+
+def test_get_timdex_dataset_reused_until_metadata_changes(s3_client):
     s3_client.put_object(
-        Bucket="test-timdex-bucket",
-        Key="the/right-prefix-for-another-file.txt",
-        Body="I am a file",
+        Bucket="test-timdex-bucket", Key="dataset/metadata/metadata.duckdb", Body=b"v1"
     )
+    with patch("timdex_dataset_api.dataset.TIMDEXDataset") as mocked_dataset:
+        mocked_dataset.side_effect = lambda **_: object()
+        td = helpers.get_timdex_dataset()
+        assert helpers.get_timdex_dataset() is td
+        mocked_dataset.assert_called_once_with(location="s3://test-timdex-bucket/dataset")
+
+        s3_client.put_object(
+            Bucket="test-timdex-bucket",
+            Key="dataset/metadata/metadata.duckdb",
+            Body=b"v2",
+        )
+        assert helpers.get_timdex_dataset() is not td
+        assert mocked_dataset.call_count == 2
+
+
+def test_get_timdex_dataset_with_metadata_version_does_not_list_metadata(s3_client):
     s3_client.put_object(
-        Bucket="test-timdex-bucket",
-        Key="a-different/prefix-for-aa-file.txt",
-        Body="I am a file",
+        Bucket="test-timdex-bucket", Key="dataset/metadata/metadata.duckdb", Body=b"v1"
     )
-    response = helpers.list_s3_files_by_prefix("test-timdex-bucket", "the/right-prefix")
-    assert response == [
-        "the/right-prefix-for-a-file.txt",
-        "the/right-prefix-for-another-file.txt",
-    ]
+    version = helpers.get_timdex_dataset_metadata_version(
+        "s3://test-timdex-bucket/dataset"
+    )
+    with (
+        patch("timdex_dataset_api.dataset.TIMDEXDataset") as mocked_dataset,
+        patch(
+            "lambdas.helpers.get_timdex_dataset_metadata_version"
+        ) as mocked_metadata_version,
+    ):
+        mocked_dataset.side_effect = lambda **_: object()
+        td = helpers.get_timdex_dataset(version)
+        assert helpers.get_timdex_dataset(version) is td
+    mocked_metadata_version.assert_not_called()
+
+
+def test_read_json_object_round_trips_written_object(s3_client):
+    helpers.write_json_object(s3_client, "test-timdex-bucket", "object.json", {"a": [1]})
+    assert helpers.read_json_object(s3_client, "test-timdex-bucket", "object.json") == {
+        "a": [1]
+    }
 
 
-def test_list_s3_files_by_prefix_no_files_raises_error():
-    with pytest.raises(errors.NoFilesError):
-        helpers.list_s3_files_by_prefix("test-timdex-bucket", "the/right-prefix")
+def test_read_json_object_missing_key_returns_none(s3_client):
+    assert (
+        helpers.read_json_object(s3_client, "test-timdex-bucket", "missing.json") is None
+    )
@@ -0,0 +1,143 @@
+# ruff: noqa: PLR2004
+
+from unittest.mock import patch
+
+import pytest
+from botocore.client import BaseClient
+
+from lambdas import errors, helpers, key_index
+
+
+def _put_files(s3_client, *keys):
+    for key in keys:
+        s3_client.put_object(Bucket="test-timdex-bucket", Key=key, Body=b"data")
+
+
+def test_step_output_key_round_trips_generated_key(make_input_payload):
+    step_output_key = key_index.StepOutputKey.for_run(
+        make_input_payload(), "extract", "index", "03-1-2"
+    )
+    assert step_output_key == key_index.StepOutputKey(
+        source="testsource",
+        run_date="2022-01-02",
+        run_type="daily",
+        step="extract",
+        load_type="index",
+        sequence="03-1-2",
+        file_type="xml",
+    )
+    key = step_output_key.encode()
+    assert key == (
+        "testsource/testsource-2022-01-02-daily-extracted-records-to-index_03-1-2.xml"
+    )
+    assert key_index.StepOutputKey.decode(key) == step_output_key
+
+
+@pytest.mark.parametrize(
+    ("source", "step", "load_type", "file_type"),
+    [
+        ("gismit", "extract", "index", "jsonl"),
+        ("gisogm", "extract", "delete", "jsonl"),
+        ("mitlibwebsite", "extract", "index", "jsonl"),
+        ("testsource", "extract", "delete", "xml"),
+        ("testsource", "transform", "index", "json"),
+        ("testsource", "transform", "delete", "txt"),
+    ],
+)
+def test_step_output_key_for_run_file_type(
+    make_input_payload, source, step, load_type, file_type
+):
+    step_output_key = key_index.StepOutputKey.for_run(
+        make_input_payload(source=source, run_type="full"), step, load_type
+    )
+    assert step_output_key.file_type == file_type
+    assert step_output_key.encode() == (
+        f"{source}/{source}-2022-01-02-full-{step}ed-records-to-{load_type}.{file_type}"
+    )
+
+
+def test_step_output_key_decode_other_key_returns_none():
+    assert key_index.StepOutputKey.decode("testsource/run-summaries/summary.json") is None
+    assert (
+        key_index.StepOutputKey.decode(
+            "testsource/othersource-2022-01-02-daily-extracted-records-to-index.xml"
+        )
+        is None
+    )
+
+
+def test_step_output_index_find(make_input_payload, s3_client):
+    _put_files(
+        s3_client,
+        "testsource/testsource-2022-01-02-daily-extracted-records-to-index_02.xml",
+        "testsource/testsource-2022-01-02-daily-extracted-records-to-index_01.xml",
+        "testsource/testsource-2022-01-02-daily-extracted-records-to-delete.xml",
+        "testsource/testsource-2022-01-02-daily-transformed-records-to-index.json",
+        "testsource/testsource-2022-01-02-full-extracted-records-to-index.xml",
+        "testsource/testsource-2022-01-03-daily-extracted-records-to-index.xml",
+    )
+    index = key_index.get_step_output_index(make_input_payload())
+    assert len(index.files) == 5
+    assert [s3_file.key for s3_file in index.find("daily", "extract")] == [
+        "testsource/testsource-2022-01-02-daily-extracted-records-to-delete.xml",
+        "testsource/testsource-2022-01-02-daily-extracted-records-to-index_01.xml",
+        "testsource/testsource-2022-01-02-daily-extracted-records-to-index_02.xml",
+    ]
+    assert [s3_file.key for s3_file in index.find("daily", "extract", "delete")] == [
+        "testsource/testsource-2022-01-02-daily-extracted-records-to-delete.xml",
+    ]
+    assert [s3_file.size for s3_file in index.find("full", "extract")] == [4]
+
+
+def test_get_step_output_index_reused_until_invalidated(make_input_payload, s3_client):
+    _put_files(
+        s3_client, "testsource/testsource-2022-01-02-daily-extracted-records-to-index.xml"
+    )
+    with patch(
+        "lambdas.helpers.list_s3_objects_by_prefix",
+        wraps=helpers.list_s3_objects_by_prefix,
+    ) as mocked_list:
+        index = key_index.get_step_output_index(make_input_payload())
+        assert (
+            key_index.get_step_output_index(make_input_payload(run_type="full")) is index
+        )
+        assert mocked_list.call_count == 1
+
+        key_index.invalidate_step_output_index(make_input_payload())
+        assert key_index.get_step_output_index(make_input_payload()) is not index
+        assert mocked_list.call_count == 2
+
+
+def test_get_step_output_index_expires_after_ttl(
+    make_input_payload, monkeypatch, s3_client
+):
+    monkeypatch.setenv("S3_KEY_INDEX_TTL_SECONDS", "0")
+    index = key_index.get_step_output_index(make_input_payload())
+    assert key_index.get_step_output_index(make_input_payload()) is not index
+
+
+def test_list_step_output_files_no_files_raises_error(make_input_payload, s3_client):
+    _put_files(
+        s3_client, "testsource/testsource-2022-01-02-full-extracted-records-to-index.xml"
+    )
+    with pytest.raises(errors.NoFilesError):
+        key_index.list_step_output_files(make_input_payload(), "extract")
+
+
+def test_step_output_index_build_lists_once_and_skips_other_keys(s3_client):
+    _put_files(
+        s3_client,
+        "testsource/testsource-2022-01-02-daily-extracted-records-to-index.xml",
+        "testsource/testsource-2022-01-02-daily-extracted-records.log",
+    )
+    make_api_call = BaseClient._make_api_call  # noqa: SLF001
+    with patch.object(
+        BaseClient, "_make_api_call", autospec=True, side_effect=make_api_call
+    ) as mocked_call:
+        index = key_index.StepOutputIndex.build(
+            "test-timdex-bucket", "testsource", "2022-01-02"
+        )
+    assert [call.args[1] for call in mocked_call.call_args_list] == ["ListObjectsV2"]
+    assert [s3_file.key for s3_file in index.files.values()] == [
+        "testsource/testsource-2022-01-02-daily-extracted-records-to-index.xml"
+    ]
@@ -0,0 +1,60 @@
+from unittest.mock import patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+from lambdas.multipart_upload import MIN_PART_SIZE, ParallelMultipartUpload
+
+
+def test_parallel_multipart_upload_small_object_uses_single_put(s3_client):
+    with ParallelMultipartUpload(s3_client, "test-timdex-bucket", "small.xml") as upload:
+        upload.write(b"<collection/>")
+    assert upload.upload_id is None
+    response = s3_client.get_object(Bucket="test-timdex-bucket", Key="small.xml")
+    assert response["Body"].read() == b"<collection/>"
+
+
+def test_parallel_multipart_upload_uploads_parts(s3_client):
+    data = bytes(range(256)) * (MIN_PART_SIZE * 2 // 256) + b"remainder"
+    with ParallelMultipartUpload(
+        s3_client,
+        "test-timdex-bucket",
+        "large.xml",
+        part_size=MIN_PART_SIZE,
+        max_in_flight=2,
+    ) as upload:
+        for start in range(0, len(data), 1024 * 1024):
+            upload.write(data[start : start + 1024 * 1024])
+    assert upload.bytes_written == len(data)
+    assert upload.upload_id is not None
+    response = s3_client.get_object(Bucket="test-timdex-bucket", Key="large.xml")
+    assert response["Body"].read() == data
+
+
+def test_parallel_multipart_upload_failure_aborts_upload(s3_client):
+    def write_parts():
+        with ParallelMultipartUpload(
+            s3_client,
+            "test-timdex-bucket",
+            "failed.xml",
+            part_size=MIN_PART_SIZE,
+            max_in_flight=1,
+        ) as upload:
+            for _ in range(4):
+                upload.write(b"x" * MIN_PART_SIZE)
+
+    with (
+        patch.object(
+            s3_client, "upload_part", side_effect=RuntimeError("part upload failed")
+        ),
+        pytest.raises(RuntimeError, match="part upload failed"),
+    ):
+        write_parts()
+    assert "Uploads" not in s3_client.list_multipart_uploads(Bucket="test-timdex-bucket")
+    with pytest.raises(ClientError):
+        s3_client.head_object(Bucket="test-timdex-bucket", Key="failed.xml")
+
+
+def test_parallel_multipart_upload_part_size_too_small_raises_error(s3_client):
+    with pytest.raises(ValueError, match="part size must be at least"):
+        ParallelMultipartUpload(s3_client, "test-timdex-bucket", "x.xml", part_size=1)
@@ -0,0 +1,108 @@
+import json
+from unittest.mock import patch
+
+from lambdas import helpers, run_summary
+
+
+def test_generate_run_summary_key(make_input_payload):
+    assert (
+        run_summary.generate_run_summary_key(make_input_payload())
+        == "testsource/run-summaries/testsource-run-abc-123-run-summary.json"
+    )
+
+
+def test_get_run_summary_computes_and_saves_summary(
+    make_input_payload, s3_client, timdex_dataset_metadata
+):
+    for key, body in (
+        ("testsource-2022-01-02-daily-extracted-records-to-index_01.xml", b"abc"),
+        ("testsource-2022-01-02-daily-extracted-records-to-index_02.xml", b"defgh"),
+        ("testsource-2022-01-01-daily-extracted-records-to-index.xml", b"ignored"),
+    ):
+        s3_client.put_object(
+            Bucket="test-timdex-bucket", Key=f"testsource/{key}", Body=body
+        )
+    summary = run_summary.get_run_summary(make_input_payload())
+    assert summary == run_summary.RunSummary(
+        source="testsource",
+        run_id="run-abc-123",
+        run_date="2022-01-02",
+        run_type="daily",
+        record_counts=helpers.RunRecordCounts(index=2, delete=1, skip=1),
+        extract_file_count=2,
+        extract_bytes=8,
+        metadata_version=helpers.get_timdex_dataset_metadata_version(
+            "s3://test-timdex-bucket/dataset"
+        ),
+    )
+    saved = s3_client.get_object(
+        Bucket="test-timdex-bucket",
+        Key="testsource/run-summaries/testsource-run-abc-123-run-summary.json",
+    )
+    assert json.loads(saved["Body"].read())["record_counts"] == {
+        "index": 2,
+        "delete": 1,
+        "skip": 1,
+        "error": 0,
+    }
+
+
+def test_get_run_summary_reads_saved_summary_without_querying_dataset(
+    make_input_payload, timdex_dataset_metadata
+):
+    summary = run_summary.get_run_summary(make_input_payload())
+    with patch("lambdas.helpers.get_dataset_run_record_counts") as mocked_counts:
+        assert run_summary.get_run_summary(make_input_payload()) == summary
+    mocked_counts.assert_not_called()
+
+
+def test_get_run_summary_recomputes_after_metadata_changes(
+    make_input_payload, s3_client, timdex_dataset_metadata
+):
+    with patch(
+        "lambdas.helpers.get_dataset_run_record_counts",
+        return_value=helpers.RunRecordCounts(),
+    ):
+        assert (
+            run_summary.get_run_summary(make_input_payload()).record_counts.to_load == 0
+        )
+    s3_client.put_object(
+        Bucket="test-timdex-bucket", Key="dataset/metadata/append/delta.parquet", Body=b""
+    )
+    summary = run_summary.get_run_summary(make_input_payload())
+    assert summary.record_counts == helpers.RunRecordCounts(index=2, delete=1, skip=1)
+
+
+def test_run_summary_to_payload():
+    summary = run_summary.RunSummary(
+        source="testsource",
+        run_id="run-abc-123",
+        run_date="2022-01-02",
+        run_type="daily",
+        record_counts=helpers.RunRecordCounts(index=3, error=1),
+        extract_file_count=1,
+        extract_bytes=10,
+    )
+    assert summary.to_payload() == {
+        "record-counts": {"index": 3, "delete": 0, "skip": 0, "error": 1},
+        "extract-file-count": 1,
+        "extract-bytes": 10,
+    }
+
+
+def test_get_run_summary_lists_dataset_metadata_once(
+    make_input_payload, s3_client, timdex_dataset_metadata
+):
+    with (
+        patch(
+            "lambdas.helpers.get_timdex_dataset_metadata_version",
+            wraps=helpers.get_timdex_dataset_metadata_version,
+        ) as mocked_metadata_version,
+        patch(
+            "lambdas.helpers.get_timdex_dataset", wraps=helpers.get_timdex_dataset
+        ) as mocked_dataset,
+    ):
+        summary = run_summary.get_run_summary(make_input_payload())
+    assert summary.record_counts == helpers.RunRecordCounts(index=2, delete=1, skip=1)
+    assert mocked_metadata_version.call_count == 1
+    mocked_dataset.assert_called_once_with(summary.metadata_version)
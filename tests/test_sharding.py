@@ -0,0 +1,74 @@
+# ruff: noqa: PLR2004, S314
+
+from xml.etree import ElementTree as ET
+
+from lambdas.multipart_upload import ParallelMultipartUpload
+from lambdas.sharding import RecordShardWriter
+
+HEADER = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n'
+    b'<collection xmlns="http://www.loc.gov/MARC21/slim">\n'
+)
+FOOTER = b"</collection>\n"
+
+
+def marc_xml(record_count):
+    records = b"".join(
+        b'<record><controlfield tag="001">%d</controlfield></record>\n' % number
+        for number in range(record_count)
+    )
+    return HEADER + records + FOOTER
+
+
+def shard_xml(s3_client, writer, chunk_size, data):
+    with writer:
+        for start in range(0, len(data), chunk_size):
+            writer.write(data[start : start + chunk_size])
+    return [
+        s3_client.get_object(Bucket="test-timdex-bucket", Key=shard.key)["Body"].read()
+        for shard in writer.shards
+    ]
+
+
+def open_shard(s3_client):
+    def _open_shard(shard_number):
+        return ParallelMultipartUpload(
+            s3_client, "test-timdex-bucket", f"shard_{shard_number}.xml"
+        )
+
+    return _open_shard
+
+
+def test_record_shard_writer_splits_by_record_count(s3_client):
+    writer = RecordShardWriter(open_shard(s3_client), max_records=2)
+    shards = shard_xml(s3_client, writer, 3, marc_xml(5))
+    assert writer.shard_record_counts == [2, 2, 1]
+    for shard in shards:
+        assert shard.startswith(HEADER)
+        assert shard.endswith(FOOTER)
+        ET.fromstring(shard)
+    assert b"".join(shards).count(b"<record>") == 5
+
+
+def test_record_shard_writer_no_empty_final_shard(s3_client):
+    writer = RecordShardWriter(open_shard(s3_client), max_records=2)
+    shard_xml(s3_client, writer, 7, marc_xml(4))
+    assert writer.shard_record_counts == [2, 2]
+
+
+def test_record_shard_writer_splits_by_bytes(s3_client):
+    data = marc_xml(100)
+    writer = RecordShardWriter(open_shard(s3_client), max_bytes=1024)
+    shards = shard_xml(s3_client, writer, 64, data)
+    assert len(shards) > 1
+    assert sum(writer.shard_record_counts) == 100
+    for shard in shards[:-1]:
+        assert 1024 <= len(shard) < 1024 + 128
+        ET.fromstring(shard)
+
+
+def test_record_shard_writer_without_records_writes_single_shard(s3_client):
+    writer = RecordShardWriter(open_shard(s3_client), max_records=2)
+    shards = shard_xml(s3_client, writer, 5, HEADER + FOOTER)
+    assert shards == [HEADER + FOOTER]
+    assert writer.shard_record_counts == [0]
@@ -0,0 +1,89 @@
+from lambdas import sitemap_diff
+
+DAILY_FIELDS = {
+    "next-step": "extract",
+    "source": "mitlibwebsite",
+    "btrix-config-yaml-file": "s3://bucket/config.yaml",
+    "btrix-sitemaps": ["https://libraries.mit.edu/sitemap.xml"],
+    "btrix-sitemap-urls-output-file": "s3://test-timdex-bucket/urls/output.txt",
+    "btrix-previous-sitemap-urls-file": "s3://test-timdex-bucket/urls/prev.txt",
+    "btrix-current-sitemap-urls-file": "s3://test-timdex-bucket/urls/current.txt",
+}
+
+
+def test_uses_sitemap_diff(make_input_payload):
+    assert sitemap_diff.uses_sitemap_diff(make_input_payload(**DAILY_FIELDS))
+    assert not sitemap_diff.uses_sitemap_diff(
+        make_input_payload(**DAILY_FIELDS, run_type="full")
+    )
+
+
+def test_read_sitemap_urls_with_and_without_lastmod(s3_client):
+    s3_client.put_object(
+        Bucket="test-timdex-bucket",
+        Key="urls.txt",
+        Body="https://a\t2022-01-01\n\nhttps://b\nhttps://c 2022-01-02\n",
+    )
+    assert list(
+        sitemap_diff.read_sitemap_urls(s3_client, "s3://test-timdex-bucket/urls.txt")
+    ) == [
+        ("https://a", "2022-01-01"),
+        ("https://b", ""),
+        ("https://c", "2022-01-02"),
+    ]
+
+
+def test_diff_sitemap_urls_counts_added_changed_and_removed_urls(s3_client):
+    s3_client.put_object(
+        Bucket="test-timdex-bucket",
+        Key="previous.txt",
+        Body=(
+            "https://unchanged\t2022-01-01\n"
+            "https://changed\t2022-01-01\n"
+            "https://no-lastmod\n"
+            "https://removed\t2022-01-01\n"
+        ),
+    )
+    s3_client.put_object(
+        Bucket="test-timdex-bucket",
+        Key="current.txt",
+        Body=(
+            "https://added\t2022-01-02\n"
+            "https://unchanged\t2022-01-01\n"
+            "https://changed\t2022-01-02\n"
+            "https://no-lastmod\n"
+        ),
+    )
+    assert sitemap_diff.diff_sitemap_urls(
+        s3_client,
+        "s3://test-timdex-bucket/previous.txt",
+        "s3://test-timdex-bucket/current.txt",
+    ) == sitemap_diff.SitemapDiff(added=1, changed=2, removed=1, unchanged=1)
+
+
+def test_create_sitemap_diff_writes_no_files(make_input_payload, s3_client):
+    s3_client.put_object(
+        Bucket="test-timdex-bucket", Key="urls/prev.txt", Body="https://a\n"
+    )
+    s3_client.put_object(
+        Bucket="test-timdex-bucket", Key="urls/current.txt", Body="https://b\n"
+    )
+    diff = sitemap_diff.create_sitemap_diff(make_input_payload(**DAILY_FIELDS))
+    assert diff.has_changes
+    assert diff.to_payload() == {"added": 1, "changed": 0, "removed": 1, "unchanged": 0}
+    assert [
+        s3_object["Key"]
+        for s3_object in s3_client.list_objects_v2(Bucket="test-timdex-bucket")[
+            "Contents"
+        ]
+        if not s3_object["Key"].startswith("dataset/")
+    ] == ["urls/current.txt", "urls/prev.txt"]
+
+
+def test_create_sitemap_diff_without_previous_file_returns_none(
+    make_input_payload, s3_client
+):
+    s3_client.put_object(
+        Bucket="test-timdex-bucket", Key="urls/current.txt", Body="https://b\n"
+    )
+    assert sitemap_diff.create_sitemap_diff(make_input_payload(**DAILY_FIELDS)) is None
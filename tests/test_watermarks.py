@@ -0,0 +1,85 @@
+import json
+
+from lambdas import watermarks
+
+RUN_DATE = "2022-01-05"
+
+
+def _save_watermark(s3_client, run_date):
+    s3_client.put_object(
+        Bucket="test-timdex-bucket",
+        Key="testsource/watermarks/testsource-harvest-watermark.json",
+        Body=json.dumps(
+            {
+                "source": "testsource",
+                "run_date": run_date,
+                "run_type": "daily",
+                "run_id": "run-previous",
+            }
+        ),
+    )
+
+
+def test_generate_harvest_watermark_key():
+    assert (
+        watermarks.generate_harvest_watermark_key("testsource")
+        == "testsource/watermarks/testsource-harvest-watermark.json"
+    )
+
+
+def test_get_harvest_from_date_without_watermark_uses_previous_day(make_input_payload):
+    assert (
+        watermarks.get_harvest_from_date(make_input_payload(run_date=RUN_DATE))
+        == "2022-01-04"
+    )
+
+
+def test_get_harvest_from_date_after_missed_days_uses_watermark(
+    make_input_payload, s3_client
+):
+    _save_watermark(s3_client, "2022-01-02")
+    assert (
+        watermarks.get_harvest_from_date(make_input_payload(run_date=RUN_DATE))
+        == "2022-01-02"
+    )
+
+
+def test_get_harvest_from_date_for_rerun_uses_previous_day(make_input_payload, s3_client):
+    _save_watermark(s3_client, "2022-01-05")
+    assert (
+        watermarks.get_harvest_from_date(make_input_payload(run_date=RUN_DATE))
+        == "2022-01-04"
+    )
+
+
+def test_update_harvest_watermark_saves_run(make_input_payload, run_id, s3_client):
+    watermarks.update_harvest_watermark(make_input_payload(run_date=RUN_DATE))
+    assert watermarks.load_harvest_watermark(
+        s3_client, "testsource"
+    ) == watermarks.HarvestWatermark(
+        source="testsource", run_date="2022-01-05", run_type="daily", run_id=run_id
+    )
+
+
+def test_update_harvest_watermark_for_earlier_run_keeps_watermark(
+    make_input_payload, s3_client
+):
+    _save_watermark(s3_client, "2022-01-06")
+    watermarks.update_harvest_watermark(make_input_payload(run_date=RUN_DATE))
+    assert watermarks.load_harvest_watermark(s3_client, "testsource").run_date == (
+        "2022-01-06"
+    )
+
+
+def test_get_harvest_from_date_for_backfill_uses_start_date(
+    make_input_payload, s3_client
+):
+    _save_watermark(s3_client, "2022-01-03")
+    input_payload = make_input_payload(
+        next_step="backfill",
+        run_date=RUN_DATE,
+        backfill_start_date="2022-01-02",
+        oai_pmh_host="https://example.com/oai",
+        oai_metadata_format="oai_dc",
+    )
+    assert watermarks.get_harvest_from_date(input_payload) == "2022-01-01"
@@ -0,0 +1,37 @@
+import io
+
+import pytest
+
+from lambdas import errors
+from lambdas.xml_validation import XMLRecordValidator
+
+XML = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n'
+    b'<collection xmlns="http://www.loc.gov/MARC21/slim">'
+    b"<record><leader>1</leader></record><record><leader>2</leader></record>"
+    b"</collection>\n"
+)
+
+
+def test_xml_record_validator_counts_records_and_passes_bytes_through():
+    target = io.BytesIO()
+    validator = XMLRecordValidator(target, "test.xml")
+    for start in range(0, len(XML), 5):
+        validator.write(XML[start : start + 5])
+    validator.close()
+    assert validator.record_count == 2  # noqa: PLR2004
+    assert validator.bytes_validated == len(XML)
+    assert target.getvalue() == XML
+
+
+def test_xml_record_validator_malformed_xml_raises_error():
+    validator = XMLRecordValidator(io.BytesIO(), "test.xml")
+    with pytest.raises(errors.InvalidXMLError, match=r"'test\.xml' is not well-formed"):
+        validator.write(b"<collection><record></collection>")
+
+
+def test_xml_record_validator_truncated_xml_raises_error_on_close():
+    validator = XMLRecordValidator(io.BytesIO(), "test.xml")
+    validator.write(b"<collection><record></record>")
+    with pytest.raises(errors.InvalidXMLError, match="after 1 records"):
+        validator.close()